@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from aiohttp import web
+from utils import parse_json_triggers, get_trigger_transcripts, extract_youtube_id
+from llm_inference import stream_explanation, choose_tier
+from explanation_prefetch import ExplanationPrefetcher, explanation_key
+from quota_scheduler import configure_scheduler, get_scheduler, INTERACTIVE
+
+
+ANALYSIS_DIR = os.getenv("SAFEWATCH_ANALYSIS_DIR", "video_analysis")
+RELOAD_INTERVAL = 5  # seconds between checks for new videos
+MAX_BATCH = 100
+MAX_CACHED_RESPONSES = 1024
+GZIP_MIN_SIZE = 512
+# Explanations cost LLM quota shared with the app, so API clients get a budget of their own
+API_EXPLANATIONS_INFLIGHT = int(os.getenv("SAFEWATCH_API_EXPLANATIONS_INFLIGHT", 4))
+API_EXPLANATIONS_PER_MINUTE = int(os.getenv("SAFEWATCH_API_EXPLANATIONS_PER_MINUTE", 20))
+# The API and the Streamlit app schedule their calls in separate processes but share the
+# AZURE_AI_KEY quota, so the API runs its LLM calls at a reduced rate of its own
+API_LLM_RATE = float(os.getenv("SAFEWATCH_API_LLM_RATE", "0.25"))  # requests per second
+API_ENDPOINT_RATES = {"llm": (API_LLM_RATE, 2)}
+STREAM_TIMEOUT = 120  # seconds without a new chunk before an explanation stream is abandoned
+
+
+def normalize_trigger(trigger):
+    """Match trigger names case-insensitively and regardless of underscores ("car_crash" == "Car crash")."""
+    return trigger.replace('_', ' ').strip().lower()
+
+
+class CachedResponse:
+    """A precomputed JSON response with its gzip variant, ETag and Last-Modified time."""
+
+    def __init__(self, data, last_modified):
+        self.body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        self.gzip_body = gzip.compress(self.body, 6) if len(self.body) >= GZIP_MIN_SIZE else None
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+        self.last_modified = int(last_modified)
+        self.headers = {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            "Cache-Control": "public, max-age=60",
+            "Vary": "Accept-Encoding",
+        }
+
+    def not_modified(self, request):
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return if_none_match.strip() == "*" or self.etag in [tag.strip() for tag in if_none_match.split(",")]
+        if_modified_since = request.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def render(self, request):
+        if self.not_modified(request):
+            return web.Response(status=304, headers=self.headers)
+        if self.gzip_body is not None and "gzip" in request.headers.get("Accept-Encoding", ""):
+            return web.Response(
+                body=self.gzip_body, content_type="application/json",
+                headers={**self.headers, "Content-Encoding": "gzip"},
+            )
+        return web.Response(body=self.body, content_type="application/json", headers=self.headers)
+
+
+class Catalog:
+    """
+    In-memory catalog of analysed videos with precomputed responses. Videos are keyed by their
+    YouTube id; trigger events are parsed once when the catalog is (re)loaded.
+    """
+
+    def __init__(self, analysis_dir=ANALYSIS_DIR):
+        self.analysis_dir = analysis_dir
+        self.index_path = os.path.join(analysis_dir, "processed_videos.json")
+        self.index_mtime = None
+        self.missing_files = []
+        self.videos = OrderedDict()
+        self.triggers = {}
+        self.responses = {}
+        self.catalog_response = None
+        self.verdicts = OrderedDict()
+        self.batches = OrderedDict()
+
+    def reload_if_changed(self):
+        """
+        Reload the catalog when processed_videos.json has changed or a missing analysis file has
+        appeared. Returns True if it was reloaded.
+        """
+        mtime = os.path.getmtime(self.index_path)
+        if mtime == self.index_mtime and not any(os.path.exists(path) for path in self.missing_files):
+            return False
+
+        with open(self.index_path, 'r') as file:
+            processed_videos = json.load(file)
+
+        videos, triggers, responses, missing_files = OrderedDict(), {}, {}, []
+        for video in processed_videos:
+            video_id = extract_youtube_id(video['url']) or video['title']
+            file_path = os.path.join(self.analysis_dir, video['json_file'])
+            previous = self.triggers.get(video_id)
+            try:
+                file_mtime = os.path.getmtime(file_path)
+            except OSError:
+                # Listed before its analysis file is written, or the file was removed
+                print(f"Skipping {video['url']}: analysis file {file_path} not found")
+                missing_files.append(file_path)
+                continue
+            # Only re-parse videos whose analysis file is new or has changed
+            if previous is not None and previous['file_mtime'] == file_mtime:
+                triggers[video_id] = previous
+            else:
+                unique_triggers, filtered_events = parse_json_triggers(file_path)
+                triggers[video_id] = {
+                    'file_path': file_path,
+                    'file_mtime': file_mtime,
+                    'unique_triggers': dict(unique_triggers),
+                    'events': filtered_events,
+                }
+            videos[video_id] = {**video, 'id': video_id, 'triggers': sorted(triggers[video_id]['unique_triggers'])}
+            responses[video_id] = CachedResponse(
+                {'id': video_id, 'unique_triggers': triggers[video_id]['unique_triggers'],
+                 'events': triggers[video_id]['events']},
+                file_mtime,
+            )
+
+        self.videos, self.triggers, self.responses = videos, triggers, responses
+        self.missing_files = missing_files
+        self.catalog_response = CachedResponse({'videos': list(videos.values())}, mtime)
+        self.verdicts = OrderedDict()
+        self.batches = OrderedDict()
+        self.index_mtime = mtime
+        print(f"Catalog loaded: {len(videos)} videos")
+        return True
+
+    def verdict(self, video_id, user_triggers):
+        wanted = {normalize_trigger(trigger) for trigger in user_triggers}
+        matched = [trigger for trigger in self.videos[video_id]['triggers'] if normalize_trigger(trigger) in wanted]
+        return {'id': video_id, 'safe': not matched, 'matched_triggers': matched}
+
+    def _cached(self, cache, key, build):
+        cached = cache.get(key)
+        if cached is None:
+            cached = CachedResponse(build(), self.index_mtime)
+            cache[key] = cached
+            if len(cache) > MAX_CACHED_RESPONSES:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return cached
+
+    def verdicts_response(self, user_triggers):
+        """Safety verdicts of every video for a trigger set, computed once per trigger set."""
+        key = frozenset(normalize_trigger(trigger) for trigger in user_triggers)
+        return self._cached(self.verdicts, key, lambda: {
+            'triggers': sorted(key),
+            'verdicts': [self.verdict(video_id, user_triggers) for video_id in self.videos],
+        })
+
+    def batch_response(self, ids):
+        """Trigger events for several videos, computed once per id list."""
+        def build():
+            return {
+                'videos': {
+                    video_id: {
+                        'unique_triggers': self.triggers[video_id]['unique_triggers'],
+                        'events': self.triggers[video_id]['events'],
+                    }
+                    for video_id in ids if video_id in self.triggers
+                },
+                'missing': [video_id for video_id in ids if video_id not in self.triggers],
+            }
+        return self._cached(self.batches, tuple(ids), build)
+
+
+def split_param(request, name):
+    return [value.strip() for value in request.query.get(name, "").split(",") if value.strip()]
+
+
+async def get_catalog(request):
+    return request.app["catalog"].catalog_response.render(request)
+
+
+async def get_video_triggers(request):
+    catalog = request.app["catalog"]
+    response = catalog.responses.get(request.match_info["video_id"])
+    if response is None:
+        raise web.HTTPNotFound(text="Unknown video")
+    return response.render(request)
+
+
+async def get_batch_triggers(request):
+    """Trigger events for several videos at once: GET ?ids=a,b,c or POST {"ids": [...]}."""
+    catalog = request.app["catalog"]
+    if request.method == "POST":
+        try:
+            ids = (await request.json()).get("ids", [])
+        except (ValueError, AttributeError):
+            ids = None
+        if not isinstance(ids, list) or not all(isinstance(video_id, str) for video_id in ids):
+            raise web.HTTPBadRequest(text="Expected a JSON body with an \"ids\" list of strings")
+    else:
+        ids = split_param(request, "ids")
+    if not ids or len(ids) > MAX_BATCH:
+        raise web.HTTPBadRequest(text=f"Pass between 1 and {MAX_BATCH} video ids")
+
+    return catalog.batch_response(ids).render(request)
+
+
+async def get_verdicts(request):
+    catalog = request.app["catalog"]
+    user_triggers = split_param(request, "triggers")
+    if not user_triggers:
+        raise web.HTTPBadRequest(text="Pass the trigger set as ?triggers=Needles,Spiders")
+    return catalog.verdicts_response(user_triggers).render(request)
+
+
+async def get_explanation(request):
+    """Stream an explanation for a video and trigger set as server-sent events."""
+    catalog = request.app["catalog"]
+    video_id = request.match_info["video_id"]
+    if video_id not in catalog.videos:
+        raise web.HTTPNotFound(text="Unknown video")
+    verdict = catalog.verdict(video_id, split_param(request, "triggers"))
+    if verdict['safe']:
+        raise web.HTTPBadRequest(text="None of the given triggers were detected in this video")
+
+    video = catalog.videos[video_id]
+    video_triggers = catalog.triggers[video_id]
+    matched = set(verdict['matched_triggers'])
+    events = [event for event in video_triggers['events'] if event['trigger'] in matched]
+    escalate = request.query.get("reasoning") == "1"
+    # Fair queuing is per client address; a client-supplied name would let one client pose as many
+    client = request.remote
+    loop = asyncio.get_running_loop()
+    transcripts = await loop.run_in_executor(None, get_trigger_transcripts, video_triggers['file_path'])
+
+    tier = choose_tier(events, transcripts, escalate)
+
+    def producer(entry):
+        return stream_explanation(
+            video['title'], verdict['matched_triggers'], events,
+            transcripts=transcripts, priority=INTERACTIVE, user=client, cancelled=entry.cancelled, tier=tier,
+        )
+
+    # Concurrent clients asking for the same explanation share one generation. New generations
+    # count against the API's explanation budget; joining a cached or in-flight one is free.
+    prefetcher = request.app["prefetcher"]
+    key = explanation_key(video['url'], verdict['matched_triggers'], tier)
+    if not prefetcher.submit(key, client, producer):
+        raise web.HTTPTooManyRequests(text="Explanation budget exhausted, try again later", headers={"Retry-After": "60"})
+
+    # Chunks are pushed onto the event loop as they are generated, so an open stream holds no thread
+    queue = asyncio.Queue()
+    if not prefetcher.listen(key, lambda kind, value: loop.call_soon_threadsafe(queue.put_nowait, (kind, value))):
+        raise web.HTTPServiceUnavailable(text="Explanation is no longer available, try again")
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await response.prepare(request)
+    while True:
+        try:
+            kind, value = await asyncio.wait_for(queue.get(), STREAM_TIMEOUT)
+        except asyncio.TimeoutError:
+            kind, value = "error", "timed out waiting for the model"
+        if kind == "chunk":
+            await response.write(f"data: {json.dumps(value)}\n\n".encode('utf-8'))
+            continue
+        if kind == "error":
+            payload = json.dumps({'error': str(value) or type(value).__name__})
+            await response.write(f"event: error\ndata: {payload}\n\n".encode('utf-8'))
+        else:
+            await response.write(b"event: done\ndata: {}\n\n")
+        break
+    await response.write_eof()
+    return response
+
+
+async def get_metrics(request):
+    """Quota scheduler metrics of this API process; the Streamlit app shows its own in the sidebar."""
+    return web.json_response(get_scheduler().metrics())
+
+
+async def reload_catalog(app):
+    while True:
+        await asyncio.sleep(RELOAD_INTERVAL)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, app["catalog"].reload_if_changed)
+        except Exception as e:
+            print(f"Catalog reload failed: {e}")
+
+
+async def start_background_tasks(app):
+    app["reload_task"] = asyncio.ensure_future(reload_catalog(app))
+
+
+async def stop_background_tasks(app):
+    app["reload_task"].cancel()
+
+
+def create_app(analysis_dir=ANALYSIS_DIR):
+    """Build the read API application with a loaded catalog."""
+    app = web.Application()
+    app["catalog"] = Catalog(analysis_dir)
+    app["catalog"].reload_if_changed()
+    configure_scheduler(API_ENDPOINT_RATES)
+    app["prefetcher"] = ExplanationPrefetcher(
+        max_inflight=API_EXPLANATIONS_INFLIGHT, max_per_minute=API_EXPLANATIONS_PER_MINUTE,
+    )
+    app.router.add_get("/videos", get_catalog)
+    app.router.add_get("/videos/triggers", get_batch_triggers)
+    app.router.add_post("/videos/triggers", get_batch_triggers)
+    app.router.add_get("/videos/{video_id}/triggers", get_video_triggers)
+    app.router.add_get("/videos/{video_id}/explanation", get_explanation)
+    app.router.add_get("/verdicts", get_verdicts)
+    app.router.add_get("/metrics", get_metrics)
+    app.on_startup.append(start_background_tasks)
+    app.on_cleanup.append(stop_background_tasks)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SafeWatch read API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port, access_log=None)
@@ -1,9 +1,13 @@
 import streamlit as st
-from llm_inference import get_deepseek_response, filter_thinking_stream
-from utils import parse_json_triggers, load_css, is_valid_url, save_json, add_entry_json
-from yt_download import download_youtube_video
+from llm_inference import stream_explanation, choose_tier
+from explanation_prefetch import ExplanationPrefetcher, explanation_key
+from quota_scheduler import get_scheduler, INTERACTIVE, PREFETCH
+from utils import parse_json_triggers, get_trigger_transcripts, extract_triggers, compare_trigger_events, load_css, is_valid_url, add_entry_json
+from archive_codec import save_archive, ARCHIVE_EXTENSION
+from yt_download import download_for_analysis
 from azure_storage import upload_mp4_to_azure_blob
 from content_understanding import send_video_to_analyzer
+from user_library import UserLibrary
 import json
 from dotenv import load_dotenv
 import os
@@ -18,13 +22,11 @@ st.set_page_config(
 # Load environment variables
 load_dotenv()
 
-# Initialize session state for storing persistent data
-if 'user_triggers' not in st.session_state:
-    # Default lists for each user
-    st.session_state.user_triggers = {
-        "John": ["Needles", "Explosions", "Spiders"],
-        "Steph": ["Car crash", "Drowning"]
-    }
+# Default trigger lists for each user, used when a profile is created for the first time
+default_user_triggers = {
+    "John": ["Needles", "Explosions", "Spiders"],
+    "Steph": ["Car crash", "Drowning"]
+}
 
 # @st.cache_data
 # def parse_triggers(json_response):
@@ -37,6 +39,18 @@ user_profiles = {
     "Steph": {"avatar": "https://randomuser.me/api/portraits/women/1.jpg"},
 }
 
+
+@st.cache_resource
+def get_user_library():
+    """Open the persisted user library once per process and make sure the sample profiles exist."""
+    library = UserLibrary()
+    for user, triggers in default_user_triggers.items():
+        library.ensure_user(user, triggers, avatar=user_profiles[user]["avatar"])
+    return library
+
+
+library = get_user_library()
+
 # Read the CSS from your style.css file
 load_css("style.css")
 
@@ -68,22 +82,18 @@ with st.sidebar:
     st.subheader("Content Preferences")
 
     # Full list of triggers (you may have a larger predefined list)
-    all_triggers = st.session_state.user_triggers[selected_user]
-
-    # Use a separate session state key to track currently selected triggers
-    if f"{selected_user}_selected_triggers" not in st.session_state:
-        st.session_state[f"{selected_user}_selected_triggers"] = all_triggers.copy()  # Start with all selected
+    all_triggers = library.get_triggers(selected_user)
 
     # Display pills with the option to unselect/select triggers dynamically
     trigger_selection = st.pills(
         label="Selected Triggers",
         options=all_triggers,  # Keep all triggers available for selection
-        default=st.session_state[f"{selected_user}_selected_triggers"],
+        default=library.get_selected_triggers(selected_user),
         selection_mode="multi"
     )
 
-    # Update session state if selection changes
-    st.session_state[f"{selected_user}_selected_triggers"] = trigger_selection
+    # Persist the selection; only videos containing a toggled trigger are updated
+    library.set_selected_triggers(selected_user, trigger_selection)
 
     st.divider()
     st.subheader("Add Video")
@@ -95,9 +105,14 @@ with st.sidebar:
         if is_valid_url(new_video_url):
             with st.spinner("Processing a new video..."):
 
-                # Download the video
-                file_path = download_youtube_video(url=new_video_url, max_length=300)
-                file_name = os.path.basename(file_path).replace(".mp4", "")
+                # Download the smallest format that is still good enough for analysis
+                file_path, download_report = download_for_analysis(url=new_video_url, max_length=300)
+                if file_path is None:
+                    st.error("Could not download the video. Check that it is available and at most 5 minutes long.")
+                    st.stop()
+                file_name = os.path.splitext(os.path.basename(file_path))[0]
+                if download_report['bytes_saved']:
+                    st.caption(f"Analysis profile saved ~{download_report['bytes_saved'] / 1e6:.1f} MB versus the 720p download")
 
                 # Upload to Azure Blob Storage
                 CONNECTION_STRING = os.getenv("AZURE_BLOB_CONNECTION_STRING")
@@ -117,29 +132,46 @@ with st.sidebar:
                 endpoint = os.getenv("AZURE_AI_ENDPOINT")
                 subscription_key = os.getenv("AZURE_AI_KEY")
                 # Send the video for analysis
-                analyzer_response = send_video_to_analyzer(endpoint, subscription_key, "triggers_analyzer", https_saas_url)
-                if analyzer_response:
-                    # Save the final analysis result to a JSON file
-                    save_json(analyzer_response, f"video_analysis/{file_name}.json")
+                analyzer_response = send_video_to_analyzer(
+                    endpoint, subscription_key, "triggers_analyzer", https_saas_url, priority=INTERACTIVE, user=selected_user
+                )
+                if not analyzer_response:
+                    st.error("Video analysis failed. Please try again later.")
+                    st.stop()
+                analysis_file = f"{file_name}{ARCHIVE_EXTENSION}"
+                # On a re-run, check that the smaller download still detects the same events as the
+                # bundled full-quality result, or the previous run when there is none
+                previous_files = [f"video_analysis/{name}" for name in (f"{file_name}.json", analysis_file)]
+                previous_file = next((path for path in previous_files if os.path.exists(path)), None)
+                if previous_file:
+                    _, baseline_events = parse_json_triggers(previous_file)
+                    _, new_events = extract_triggers(analyzer_response)
+                    parity = compare_trigger_events(baseline_events, new_events)
+                    print(f"Detection parity for {file_name}: {parity}")
+                    st.caption(f"Detection parity vs previous analysis: recall {parity['recall']:.0%}, precision {parity['precision']:.0%}")
+
+                # Save the final analysis result as a compressed archive
+                save_archive(analyzer_response, f"video_analysis/{analysis_file}")
                 
                 new_entry = {
                     "url": new_video_url,
-                    "json_file": f"{file_name}.json",
+                    "json_file": analysis_file,
                     "title": file_name
                 }
-                # Add the new entry to the processed videos JSON file
-                add_entry_json("video_analysis/processed_videos.json", new_entry)
+                # Add the new entry to the processed videos JSON file, replacing the entry of a re-run
+                add_entry_json("video_analysis/processed_videos.json", new_entry, key="url")
                 
-                # Parse triggers for the new video
-                unique_triggers, filtered_events = parse_json_triggers(f"video_analysis/{file_name}.json")
+                # Parse triggers for the new video and update every user's view
+                _, filtered_events = parse_json_triggers(f"video_analysis/{analysis_file}")
+                library.ingest_video(new_video_url, new_entry['title'], new_entry['json_file'], filtered_events)
                 
                 # Add to session state videos
-                st.session_state.videos[new_video_url] = {
-                    **new_entry,
-                    'unique_triggers': unique_triggers,
-                    'filtered_events': filtered_events,
-                    'ai_response': None
-                }
+                st.session_state.videos[new_video_url] = dict(new_entry)
+
+    st.divider()
+    # Queue depth, wait times and 429s of this process's analyzer, poll and LLM calls
+    with st.expander("Quota scheduler"):
+        st.json(get_scheduler().metrics())
 
 
 def initialize_video_data():
@@ -147,61 +179,111 @@ def initialize_video_data():
     if 'videos' not in st.session_state:
         st.session_state.videos = {}
     
-    # Always load from the JSON file to ensure all videos are included
-    with open("video_analysis/processed_videos.json", "r") as file:
-        processed_videos = json.load(file)
-    
-    for video in processed_videos:
-        url = video['url']
+    # Re-read the video list only when processed_videos.json has changed since this session last
+    # looked, so an ordinary rerun costs one stat() however large the library is
+    index_path = "video_analysis/processed_videos.json"
+    index_mtime = os.path.getmtime(index_path)
+    if st.session_state.get('videos_mtime') != index_mtime:
+        with open(index_path, "r") as file:
+            processed_videos = json.load(file)
+        known_urls = library.video_urls()
         
-        # Only add if not already in session state
-        if url not in st.session_state.videos:
-            # Parse triggers for each video
-            unique_triggers, filtered_events = parse_json_triggers(f"video_analysis/{video['json_file']}")
+        for video in processed_videos:
+            url = video['url']
+            
+            # Parse triggers only for videos the user library has not seen yet
+            if url not in known_urls:
+                _, filtered_events = parse_json_triggers(f"video_analysis/{video['json_file']}")
+                library.ingest_video(url, video['title'], video['json_file'], filtered_events)
             
-            st.session_state.videos[url] = {
-                **video,  # Include original video metadata
-                'unique_triggers': unique_triggers,
-                'filtered_events': filtered_events,
-                'ai_response': None
-            }
+            # Only add if not already in session state
+            if url not in st.session_state.videos:
+                st.session_state.videos[url] = dict(video)  # Original video metadata
+        st.session_state.videos_mtime = index_mtime
     
     # Initialize clicked video tracker
     if 'clicked_video' not in st.session_state:
         st.session_state.clicked_video = None
 
 
-def generate_ai_response(video_data, unique_user_triggers):
+@st.cache_data
+def load_trigger_transcripts(json_file):
+    """Transcript text of the flagged shots of a video, used as evidence in the prompt."""
+    return get_trigger_transcripts(f"video_analysis/{json_file}")
+
+
+@st.cache_resource
+def get_explanation_prefetcher():
+    """Explanation cache and background executor shared by all sessions."""
+    return ExplanationPrefetcher()
+
+
+prefetcher = get_explanation_prefetcher()
+
+
+def request_ai_response(url, video_data, unique_user_triggers, user_events, escalate=False, speculative=True):
     """
-    Generate or retrieve AI response for a specific video.
+    Start generating the AI response for a video in the background, or join one already in flight.
     
     Args:
+        url (str): Video URL
         video_data (dict): Dictionary containing video metadata
         unique_user_triggers (list): List of user-selected triggers
+        user_events (list): Detected events for the user's triggers
+        escalate (bool, optional): Use the reasoning model instead of the fast one
+        speculative (bool, optional): Prefetch within the prefetch budget rather than on request.
+            Only explanations routed to the fast tier are prefetched.
     
     Returns:
-        str: AI-generated response about video triggers
+        tuple: Explanation cache key, or None if nothing was started (budget exhausted, or a
+        speculative request for the reasoning tier)
     """
-    # Check if response is already in cache
-    if video_data['ai_response']:
-        return video_data['ai_response']
+    # Read in the script thread; Streamlit caches are not available in the background executor
+    transcripts = load_trigger_transcripts(video_data['json_file'])
+    tier = choose_tier(user_events, transcripts, escalate)
+    if speculative and tier != "fast":
+        return None
+    key = explanation_key(url, unique_user_triggers, tier)
     
-    # Generate new response
-    response = get_deepseek_response(
-        video_data['title'], 
-        unique_user_triggers
-    )
+    def producer(entry):
+        # Generate new response grounded in what was actually detected. A prefetch the user
+        # asks for while it is still queued is promoted to interactive priority.
+        return stream_explanation(
+            video_data['title'], 
+            unique_user_triggers,
+            user_events,
+            transcripts=transcripts,
+            priority=lambda: PREFETCH if entry.speculative else INTERACTIVE,
+            user=selected_user,
+            cancelled=entry.cancelled,
+            tier=tier
+        )
     
-    def collect_response(response_stream):
-        full_response = ""
-        for chunk in filter_thinking_stream(response_stream):
-            full_response += chunk
-            yield chunk
-        
-        # Cache the full response
-        video_data['ai_response'] = full_response
+    started = prefetcher.submit(key, selected_user, producer, speculative=speculative)
+    return key if started else None
+
+
+def generate_ai_response(url, video_data, unique_user_triggers, user_events, escalate=False):
+    """
+    Generate or retrieve AI response for a specific video.
     
-    return collect_response(response)
+    Args:
+        url (str): Video URL
+        video_data (dict): Dictionary containing video metadata
+        unique_user_triggers (list): List of user-selected triggers
+        user_events (list): Detected events for the user's triggers
+        escalate (bool, optional): Use the reasoning model instead of the fast one
+    
+    Returns:
+        str or generator: The finished response text, or a stream attached to the in-flight generation
+    """
+    key = request_ai_response(url, video_data, unique_user_triggers, user_events, escalate, speculative=False)
+    
+    # Prefetched responses are usually finished by the time the user asks
+    text = prefetcher.get_text(key)
+    if text is not None:
+        return text
+    return prefetcher.stream(key) or iter(())
 
 
 def render_video_grid(num_columns=3):
@@ -211,6 +293,16 @@ def render_video_grid(num_columns=3):
     
     st.subheader("Your Videos")
     
+    # Materialized view of the library for the selected user
+    user_view = library.get_user_view(selected_user)
+    
+    # Cancel the previous user's speculative explanations after a profile switch
+    previous_user = st.session_state.get('prefetch_user')
+    if previous_user is not None and previous_user != selected_user:
+        prefetcher.cancel_owner(previous_user)
+    st.session_state.prefetch_user = selected_user
+    prefetch_keys = set()
+    
     # Create columns dynamically
     columns = st.columns(num_columns)
     
@@ -221,16 +313,11 @@ def render_video_grid(num_columns=3):
                 # Display video
                 st.video(url)
                 
-                # Check user triggers
-                unique_triggers = video_data['unique_triggers']
-                filtered_events = video_data['filtered_events']
+                # Look up the user's precomputed row for this video
+                view_row = user_view.get(url, {'flagged': False, 'matched_triggers': [], 'matched_events': []})
                 
                 # Determine if video has user-selected triggers
-                has_user_triggers = (
-                    len(unique_triggers) > 0 and 
-                    any(trigger in st.session_state[f"{selected_user}_selected_triggers"] 
-                        for trigger in unique_triggers.keys())
-                )
+                has_user_triggers = view_row['flagged']
                 
                 # Render trigger warnings or no triggers found
                 if not has_user_triggers:
@@ -240,22 +327,24 @@ def render_video_grid(num_columns=3):
                     st.write("")
                     st.write("")
                 else:
-                    # Filter and display triggers
-                    unique_user_triggers = [
-                        trigger for trigger in unique_triggers.keys() 
-                        if trigger in st.session_state[f"{selected_user}_selected_triggers"]
-                    ]
-                    trigger_list = ", ".join(sorted(unique_user_triggers))
+                    # Display triggers
+                    unique_user_triggers = view_row['matched_triggers']
+                    trigger_list = ", ".join(unique_user_triggers)
                     
                     st.write(f"❗ Trigger Warning: {trigger_list}")
                     
+                    # Events for user's selected triggers
+                    filtered_user_events = view_row['matched_events']
+                    
+                    # Runs on every render of a flagged card, opened or not: Streamlit cannot tell us
+                    # when the expander opens. Cards routed to the reasoning tier are not prefetched,
+                    # the prefetch budget caps how many start, and cached or in-flight explanations
+                    # are not started again.
+                    prefetch_key = request_ai_response(url, video_data, unique_user_triggers, filtered_user_events)
+                    if prefetch_key is not None:
+                        prefetch_keys.add(prefetch_key)
+                    
                     with st.expander('See More'):
-                        # Filter events for user's selected triggers
-                        filtered_user_events = [
-                            event for event in filtered_events 
-                            if event['trigger'] in st.session_state[f"{selected_user}_selected_triggers"]
-                        ]
-                        
                         # Display trigger events
                         st.write(f"All triggers chronologically ({len(filtered_user_events)} events):")
                         for event in filtered_user_events:
@@ -269,16 +358,29 @@ def render_video_grid(num_columns=3):
                         
                         if st.button("Ask AI", key=button_key, icon="🪄"):
                             st.session_state.clicked_video = url
+                        deep_reasoning = st.checkbox("Deep reasoning (slower)", key=f"reasoning_{url}")
                         
                         # Generate or display AI response
                         if st.session_state.clicked_video == url:
-                            with st.spinner("Thinking..."):
-                                st.write_stream(
-                                    generate_ai_response(
-                                        video_data, 
-                                        unique_user_triggers
-                                    )
-                                )
+                            ai_response = generate_ai_response(
+                                url,
+                                video_data, 
+                                unique_user_triggers,
+                                filtered_user_events,
+                                escalate=deep_reasoning
+                            )
+                            if isinstance(ai_response, str):
+                                st.write(ai_response)
+                            else:
+                                try:
+                                    with st.spinner("Thinking..."):
+                                        st.write_stream(ai_response)
+                                except Exception as e:
+                                    print(f"AI response failed for {url}: {e}")
+                                    st.error("Could not generate the AI response. Please try again.")
+    
+    # Drop speculative work for cards or trigger selections that are no longer shown
+    prefetcher.cancel_owner(selected_user, keep=prefetch_keys)
 
 # Call the function to render videos
 render_video_grid()
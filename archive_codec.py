@@ -0,0 +1,167 @@
+import re
+import struct
+import msgpack
+import zstandard
+
+
+# Archive layout: MAGIC | u32 index length | zstd(msgpack(index)) | zstd(msgpack(payload))
+# The index holds only the projected fields needed for trigger parsing so it can be
+# decoded without touching the (much larger) full payload.
+MAGIC = b"SWZ1"
+ARCHIVE_EXTENSION = ".swz"
+HEADER = struct.Struct(">4sI")
+COMPRESSION_LEVEL = 10
+PACKED_FIELDS_KEY = "\x00fields"
+
+SHOT_PATTERN = re.compile(r'# Shot (\d+:\d+)\.\d+ => \d+:\d+\.\d+')
+TRANSCRIPT_PATTERN = re.compile(r'## Transcript\n```\nWEBVTT\n(.*?)```', re.DOTALL)
+VOICE_TAG_PATTERN = re.compile(r'<v [^>]*>|</v>')
+
+
+def is_archive(file_path):
+    """Check whether a file is a compressed analysis archive rather than plain JSON."""
+    with open(file_path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def shot_transcript(markdown):
+    """Return the spoken text of a shot's WEBVTT transcript block, without cue timings or voice tags."""
+    match = TRANSCRIPT_PATTERN.search(markdown)
+    if not match:
+        return ""
+    lines = [
+        VOICE_TAG_PATTERN.sub('', line).strip()
+        for line in match.group(1).splitlines()
+        if line.strip() and '-->' not in line
+    ]
+    return " ".join(lines)
+
+
+def project_shots(data):
+    """
+    Project an analyzer response down to what trigger parsing needs: for every shot whose
+    markdown has a start time, the start time rounded to MM:SS, the shot timing in
+    milliseconds, the names of boolean fields set to true and, for shots with at least one
+    true field, the transcript text (used as evidence for explanations).
+
+    Returns:
+        list: [start_time, start_ms, end_ms, [true field names], transcript] per shot
+    """
+    shots = []
+    for content in data['result']['contents']:
+        time_range_match = SHOT_PATTERN.search(content.get('markdown', ''))
+        if not time_range_match:
+            continue
+
+        true_fields = [
+            field_name for field_name, field_value in content.get('fields', {}).items()
+            if field_name != 'timestamps'
+            and field_value.get('type') == 'boolean' and field_value.get('valueBoolean') == True
+        ]
+        transcript = shot_transcript(content['markdown']) if true_fields else ""
+        shots.append([
+            time_range_match.group(1), content.get('startTimeMs'), content.get('endTimeMs'), true_fields, transcript
+        ])
+    return shots
+
+
+def _pack_fields(fields):
+    """Collapse plain boolean field objects to bare booleans; everything else is kept verbatim."""
+    packed = {}
+    for name, value in fields.items():
+        if isinstance(value, dict) and list(value.keys()) == ['type', 'valueBoolean'] \
+                and value['type'] == 'boolean' and isinstance(value['valueBoolean'], bool):
+            packed[name] = value['valueBoolean']
+        else:
+            packed[name] = value
+    return packed
+
+
+def _unpack_fields(fields):
+    return {
+        name: {'type': 'boolean', 'valueBoolean': value} if isinstance(value, bool) else value
+        for name, value in fields.items()
+    }
+
+
+def _pack_payload(data):
+    """
+    Apply the schema-aware field encoding to every content entry of an analyzer response.
+    Encoded entries store their fields under PACKED_FIELDS_KEY (in the same key position) so
+    decoding never has to guess which entries were encoded.
+    """
+    contents = (data.get('result') or {}).get('contents')
+    if not isinstance(contents, list):
+        return data
+
+    packed_contents = []
+    for content in contents:
+        fields = content.get('fields') if isinstance(content, dict) else None
+        if isinstance(fields, dict) and PACKED_FIELDS_KEY not in content \
+                and not any(isinstance(value, bool) for value in fields.values()):
+            content = {
+                (PACKED_FIELDS_KEY if key == 'fields' else key): (_pack_fields(value) if key == 'fields' else value)
+                for key, value in content.items()
+            }
+        packed_contents.append(content)
+    return {**data, 'result': {**data['result'], 'contents': packed_contents}}
+
+
+def _unpack_payload(data):
+    contents = (data.get('result') or {}).get('contents')
+    if not isinstance(contents, list):
+        return data
+
+    data['result']['contents'] = [
+        {
+            ('fields' if key == PACKED_FIELDS_KEY else key): (_unpack_fields(value) if key == PACKED_FIELDS_KEY else value)
+            for key, value in content.items()
+        } if isinstance(content, dict) and PACKED_FIELDS_KEY in content else content
+        for content in contents
+    ]
+    return data
+
+
+def encode_archive(data):
+    """Encode an analyzer response as archive bytes."""
+    compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+    index = {'id': data.get('id'), 'status': data.get('status'), 'shots': project_shots(data)}
+    index_frame = compressor.compress(msgpack.packb(index, use_bin_type=True))
+    payload_frame = compressor.compress(msgpack.packb(_pack_payload(data), use_bin_type=True))
+    return HEADER.pack(MAGIC, len(index_frame)) + index_frame + payload_frame
+
+
+def decode_archive(blob):
+    """Decode archive bytes back into the original analyzer response."""
+    magic, index_length = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not an analysis archive")
+    payload_frame = blob[HEADER.size + index_length:]
+    data = msgpack.unpackb(zstandard.ZstdDecompressor().decompress(payload_frame), raw=False)
+    return _unpack_payload(data)
+
+
+def save_archive(data, file_path):
+    """Write an analyzer response to `file_path` as a compressed archive."""
+    with open(file_path, 'wb') as file:
+        file.write(encode_archive(data))
+    print(f"Response archived locally as {file_path}")
+
+
+def load_archive(file_path):
+    """Read the full, losslessly restored analyzer response from an archive."""
+    with open(file_path, 'rb') as file:
+        return decode_archive(file.read())
+
+
+def load_archive_index(file_path):
+    """
+    Read only the projected index (shot timing and true boolean fields) from an archive,
+    without reading or decompressing the full payload.
+    """
+    with open(file_path, 'rb') as file:
+        magic, index_length = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{file_path} is not an analysis archive")
+        index_frame = file.read(index_length)
+    return msgpack.unpackb(zstandard.ZstdDecompressor().decompress(index_frame), raw=False)
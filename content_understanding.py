@@ -4,65 +4,87 @@ import time
 import os
 from dotenv import load_dotenv
 from utils import load_json, save_json
+from http_client import response_json
+from quota_scheduler import scheduled_request, INTERACTIVE
 
 # Load environment variables from .env file
 load_dotenv()
 
 
 # Create a custom analyzer
-def create_analyzer(endpoint, subscription_key, analyzer_id, json_file):
+def create_analyzer(endpoint, subscription_key, analyzer_id, json_file, priority=INTERACTIVE, user=None):
     request_body = load_json(json_file)  # Load JSON from file
     url = f"{endpoint}/contentunderstanding/analyzers/{analyzer_id}?api-version=2024-12-01-preview"
     headers = {"Ocp-Apim-Subscription-Key": subscription_key, "Content-Type": "application/json"}
 
-    response = requests.put(url, headers=headers, json=request_body)
+    try:
+        response = scheduled_request("PUT", url, "analyzer", priority, user, headers=headers, json=request_body)
+    except requests.RequestException as e:
+        print(f"Failed to create analyzer: {e}")
+        return None
+
     if response.status_code == 201:
         print("Analyzer creation request submitted successfully.")
         operation_url = response.headers["Operation-Location"]
-        return poll_status(operation_url, headers, "analyzer creation")
+        return poll_status(operation_url, headers, "analyzer creation", priority=priority, user=user)
     else:
         print(f"Failed to create analyzer. Status code: {response.status_code}")
-        print(response.json())
+        print(response_json(response))
         return None
 
 
 # Send a video for analysis
-def send_video_to_analyzer(endpoint, subscription_key, analyzer_id, file_url):
+# Priority is INTERACTIVE for single-video adds and BACKFILL for bulk re-analysis
+def send_video_to_analyzer(endpoint, subscription_key, analyzer_id, file_url, priority=INTERACTIVE, user=None):
     url = f"{endpoint}/contentunderstanding/analyzers/{analyzer_id}:analyze?api-version=2024-12-01-preview"
     headers = {"Ocp-Apim-Subscription-Key": subscription_key, "Content-Type": "application/json"}
     request_body = {"url": file_url}
 
-    response = requests.post(url, headers=headers, json=request_body)
+    try:
+        response = scheduled_request("POST", url, "analyzer", priority, user, headers=headers, json=request_body)
+    except requests.RequestException as e:
+        print(f"Failed to submit video for analysis: {e}")
+        return None
+
     if response.status_code == 202:
         print("Video analysis request accepted.")
         operation_url = response.headers["Operation-Location"]
-        return poll_status(operation_url, headers, "video analysis")
+        return poll_status(operation_url, headers, "video analysis", priority=priority, user=user)
     else:
         print(f"Failed to submit video for analysis. Status code: {response.status_code}")
-        print(response.json())
+        print(response_json(response))
         return None
 
 
 # Poll the operation status periodically (replaces time.sleep)
-def poll_status(operation_url, headers, operation_type):
+def poll_status(operation_url, headers, operation_type, interval=30, max_wait=1800, priority=INTERACTIVE, user=None):
     print(f"Polling {operation_type} status. This may take some time...")
+    deadline = time.monotonic() + max_wait
     while True:
-        response = requests.get(operation_url, headers=headers)
+        try:
+            response = scheduled_request("GET", operation_url, "poll", priority, user, headers=headers)
+        except requests.RequestException as e:
+            print(f"Failed to poll {operation_type} status: {e}")
+            return None
+
         if response.status_code == 200:
-            status_data = response.json()
+            status_data = response_json(response)
             status = status_data.get("status")
             if status == "Succeeded":
                 print(f"{operation_type.capitalize()} completed successfully!")
                 return status_data  # Return final result data
             elif status in ["Running", "NotStarted"]:
-                print(f"{operation_type.capitalize()} in progress... Checking again in 30 seconds.")
-                time.sleep(30)
+                if time.monotonic() + interval > deadline:
+                    print(f"{operation_type.capitalize()} did not finish within {max_wait} seconds, giving up.")
+                    return None
+                print(f"{operation_type.capitalize()} in progress... Checking again in {interval} seconds.")
+                time.sleep(interval)
             else:
                 print(f"{operation_type.capitalize()} failed with status: {status}")
                 return None
         else:
             print(f"Failed to poll {operation_type} status. Status code: {response.status_code}")
-            print(response.json())
+            print(response_json(response))
             return None
 
 
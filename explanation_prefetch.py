@@ -0,0 +1,219 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def explanation_key(url, user_triggers, tier="fast"):
+    """Cache key for an explanation: the same video, trigger set and model tier share one answer."""
+    return (url, tuple(sorted(user_triggers)), tier)
+
+
+class ExplanationEntry:
+    """Buffered output of one explanation stream, readable while it is still being generated."""
+
+    def __init__(self, owner, speculative):
+        self.owner = owner
+        self.speculative = speculative
+        self.chunks = []
+        self.done = False
+        self.cancelled = threading.Event()
+        self.error = None
+        self.future = None
+        self.listeners = []
+        self.condition = threading.Condition()
+
+    @property
+    def text(self):
+        with self.condition:
+            return "".join(self.chunks)
+
+    def finish(self, listener):
+        if self.error is not None:
+            listener("error", self.error)
+        else:
+            listener("done", None)
+
+
+class ExplanationPrefetcher:
+    """
+    Generates explanations in a bounded background executor and buffers them in a cache shared
+    by all sessions, so "Ask AI" can attach to an in-flight stream or return finished text.
+
+    Speculative work is limited by `max_inflight` concurrent prefetches and `max_per_minute`
+    started prefetches; interactive requests bypass both limits. Prefetches that are no longer
+    wanted (e.g. after a profile switch) are cancelled with cancel_owner().
+    """
+
+    # Workers exceed max_inflight so interactive requests never wait behind queued prefetches
+    def __init__(self, max_workers=6, max_inflight=4, max_per_minute=20, max_entries=256):
+        self.max_inflight = max_inflight
+        self.max_per_minute = max_per_minute
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="explanation-prefetch")
+        self._entries = OrderedDict()
+        self._started = deque()
+        self._lock = threading.Lock()
+
+    def _within_budget(self):
+        now = time.monotonic()
+        while self._started and now - self._started[0] > 60:
+            self._started.popleft()
+        inflight = sum(1 for entry in self._entries.values() if entry.speculative and not entry.done)
+        return inflight < self.max_inflight and len(self._started) < self.max_per_minute
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            for key, entry in self._entries.items():
+                if entry.done:
+                    del self._entries[key]
+                    break
+            else:
+                return
+
+    def submit(self, key, owner, producer, speculative=True):
+        """
+        Start generating an explanation unless one is already cached or in flight.
+
+        Args:
+            key (tuple): Cache key from explanation_key()
+            owner (str): Who asked for it (the user), used for cancellation
+            producer (callable): Called with the ExplanationEntry, returns an iterator of text chunks.
+                It should stop once `entry.cancelled` is set and may read `entry.speculative` (which
+                becomes False when a user asks for the explanation) to set its scheduler priority.
+            speculative (bool, optional): Subject the request to the prefetch budget. Defaults to True.
+
+        Returns:
+            bool: True if the explanation is cached, in flight, failed but not yet reported, or was started
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            # A kept failure is returned as is, so the next stream() reader is shown the error
+            if entry is not None and not entry.cancelled.is_set():
+                if not speculative:
+                    entry.speculative = False
+                self._entries.move_to_end(key)
+                return True
+            if speculative and not self._within_budget():
+                return False
+
+            entry = ExplanationEntry(owner, speculative)
+            self._entries[key] = entry
+            if speculative:
+                self._started.append(time.monotonic())
+            self._evict()
+            entry.future = self._executor.submit(self._run, key, entry, producer)
+            return True
+
+    def _run(self, key, entry, producer):
+        if entry.cancelled.is_set():
+            return
+        stream = None
+        try:
+            # The producer gets the entry so it can give up before the stream yields anything
+            stream = producer(entry)
+            for chunk in stream:
+                if entry.cancelled.is_set():
+                    break
+                with entry.condition:
+                    entry.chunks.append(chunk)
+                    entry.condition.notify_all()
+                    for listener in entry.listeners:
+                        listener("chunk", chunk)
+        except Exception as e:
+            print(f"Explanation generation failed for {key[0]}: {e}")
+            entry.error = e
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            with entry.condition:
+                entry.done = True
+                entry.condition.notify_all()
+                listeners, entry.listeners = entry.listeners, []
+                for listener in listeners:
+                    entry.finish(listener)
+            # Drop cancelled entries and failed prefetches so the next request starts afresh. A failure
+            # someone asked for is kept until a reader has been shown the error.
+            if entry.cancelled.is_set() or (entry.error is not None and (entry.speculative or listeners)):
+                self._discard(key, entry)
+
+    def _discard(self, key, entry):
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def cancel_owner(self, owner, keep=()):
+        """Cancel the speculative prefetches of `owner` except those whose keys are in `keep`."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.owner == owner and entry.speculative and not entry.done and key not in keep:
+                    entry.cancelled.set()
+                    if entry.future is not None and entry.future.cancel():
+                        del self._entries[key]
+
+    def get_text(self, key):
+        """Return the finished explanation text, or None if it is missing or still being generated."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or not entry.done or entry.cancelled.is_set() or entry.error is not None:
+            return None
+        return entry.text
+
+    def listen(self, key, listener):
+        """
+        Push an explanation to `listener` rather than blocking a thread on it: listener("chunk", text)
+        for every chunk produced so far and to come, then listener("done", None) or
+        listener("error", exception). Later calls come from the generating thread, so the
+        listener must not block (e.g. hand off with loop.call_soon_threadsafe).
+
+        Returns:
+            bool: False if nothing is cached or in flight for `key`
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return False
+        with entry.condition:
+            for chunk in entry.chunks:
+                listener("chunk", chunk)
+            if entry.done:
+                entry.finish(listener)
+            else:
+                entry.listeners.append(listener)
+                return True
+        if entry.error is not None:
+            self._discard(key, entry)
+        return True
+
+    def stream(self, key, timeout=120):
+        """
+        Yield the buffered chunks of an explanation, then follow the stream until it finishes.
+        If generation failed, the generator raises the error after the chunks produced so far.
+
+        Returns:
+            generator or None: None if nothing is cached or in flight for `key`
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        def follow():
+            position = 0
+            while True:
+                with entry.condition:
+                    if position == len(entry.chunks) and not entry.done:
+                        if not entry.condition.wait(timeout):
+                            return
+                    chunks = entry.chunks[position:]
+                    done = entry.done
+                position += len(chunks)
+                for chunk in chunks:
+                    yield chunk
+                if done and position == len(entry.chunks):
+                    if entry.error is not None:
+                        self._discard(key, entry)
+                        raise entry.error
+                    return
+
+        return follow()
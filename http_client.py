@@ -0,0 +1,239 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+
+# (connect, read) timeouts in seconds for each logical endpoint
+ENDPOINT_TIMEOUTS = {
+    "analyzer": (5, 60),
+    "poll": (5, 15),
+    "metadata": (3, 5),
+    "default": (5, 30),
+}
+
+# Status codes worth retrying: throttling and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Non-idempotent requests are only retried when the server did not process them
+SAFE_RETRY_STATUS_CODES = {429, 503}
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised when a request is refused because the host's circuit is open."""
+
+
+def connection_not_made(error):
+    """Check whether a request failed before a connection was established, so the server never saw it."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # Refused connections and DNS failures arrive as a ConnectionError wrapping urllib3's
+    # NewConnectionError (a ConnectTimeoutError subclass); dropped connections wrap a ProtocolError
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, ConnectTimeoutError)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for a single host.
+
+    After `failure_threshold` consecutive failures the circuit opens and every call
+    is refused for `reset_timeout` seconds. After that a single trial call is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_neutral(self):
+        """Release a half-open trial slot without counting the outcome (e.g. the call was throttled)."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+class HttpTransport:
+    """
+    Shared HTTP transport: one keep-alive session with pooled connections, per-endpoint
+    timeouts, jittered exponential backoff on 429/5xx and a circuit breaker per host.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=20, max_retries=3,
+                 backoff_base=0.5, backoff_max=20, failure_threshold=5, reset_timeout=30):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        # Retries are handled here rather than by urllib3 so they go through the breaker
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._breakers = {}
+        self._throttle_listeners = []
+        self._lock = threading.Lock()
+
+    def add_throttle_listener(self, listener):
+        """Register `listener(endpoint, retry_after)` to be called whenever an endpoint answers 429."""
+        self._throttle_listeners.append(listener)
+
+    def breaker_for(self, url):
+        """Return the circuit breaker for the host of `url`."""
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def backoff_delay(self, attempt, response=None):
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, url, endpoint="default", timeout=None, before_attempt=None, **kwargs):
+        """
+        Send a request through the pooled session.
+
+        Args:
+            method (str): HTTP method
+            url (str): Target URL
+            endpoint (str, optional): Key into ENDPOINT_TIMEOUTS. Defaults to "default".
+            timeout (optional): Overrides the endpoint timeout.
+            before_attempt (callable, optional): Called before every attempt, retries included,
+                e.g. to pass each attempt through the quota scheduler
+            **kwargs: Passed through to requests.Session.request
+
+        Returns:
+            requests.Response: The final response, which may still be a 429/5xx once retries are exhausted
+
+        Raises:
+            CircuitOpenError: If the host's circuit is open
+            requests.RequestException: If the last attempt failed at the network level
+        """
+        method = method.upper()
+        if timeout is None:
+            timeout = ENDPOINT_TIMEOUTS.get(endpoint, ENDPOINT_TIMEOUTS["default"])
+        retry_statuses = RETRY_STATUS_CODES if method in IDEMPOTENT_METHODS else SAFE_RETRY_STATUS_CODES
+        breaker = self.breaker_for(url)
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            if before_attempt is not None:
+                before_attempt()
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {urlsplit(url).netloc}, refusing {method} request")
+
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.RequestException as e:
+                breaker.record_failure()
+                # A non-idempotent call may already have been processed unless it never left the client
+                if method in IDEMPOTENT_METHODS:
+                    retryable = isinstance(e, (requests.ConnectionError, requests.Timeout))
+                else:
+                    retryable = connection_not_made(e)
+                if last_attempt or not retryable:
+                    raise
+                time.sleep(self.backoff_delay(attempt))
+                continue
+
+            # Throttling is not an outage: a 429 only releases a half-open trial slot and is
+            # left to the backoff and the quota scheduler
+            if response.status_code == 429:
+                breaker.record_neutral()
+            elif response.status_code in RETRY_STATUS_CODES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            if response.status_code == 429:
+                retry_after = response.headers.get("Retry-After")
+                for listener in self._throttle_listeners:
+                    listener(endpoint, float(retry_after) if retry_after and retry_after.isdigit() else None)
+
+            if response.status_code not in retry_statuses or last_attempt:
+                return response
+
+            print(f"{method} {url} returned {response.status_code}, retrying ({attempt + 1}/{self.max_retries})...")
+            # With admission control the paused bucket already holds the retry back
+            if before_attempt is None or response.status_code != 429:
+                time.sleep(self.backoff_delay(attempt, response))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Return the process-wide shared transport, creating it on first use."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HttpTransport()
+        return _transport
+
+
+def response_json(response):
+    """Decode a JSON response body, falling back to the raw text for non-JSON error bodies."""
+    try:
+        return response.json()
+    except ValueError:
+        return {"status_code": response.status_code, "body": response.text[:1000]}
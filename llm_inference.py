@@ -2,33 +2,202 @@ from collections import defaultdict
 from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import SystemMessage, UserMessage
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError
 import os
+import time
 from dotenv import load_dotenv
+from quota_scheduler import get_scheduler, INTERACTIVE
 
 # Load environment variables from .env file
 load_dotenv()
 
-def get_deepseek_response(video_title, user_triggers):
+# Model tiers: a fast non-reasoning model by default, DeepSeek-R1 on request or low confidence
+MODEL_TIERS = {
+    "fast": {"model": os.getenv("AZURE_FAST_MODEL", "gpt-4o-mini"), "max_tokens": 250},
+    "reasoning": {"model": os.getenv("AZURE_REASONING_MODEL", "DeepSeek-R1"), "max_tokens": 500},
+}
+
+SYSTEM_PROMPT = (
+    "You help users avoid disturbing content in videos. Using only the detections provided, "
+    "explain briefly why the video may be disturbing for this user and when. Be short and to the point."
+)
+
+
+def build_trigger_digest(filtered_events, transcripts=None, max_timestamps=5, max_snippets=2, max_snippet_chars=120):
+    """
+    Build a compact text digest of detected trigger events for the prompt.
+
+    Args:
+        filtered_events (list): Events from parse_json_triggers, already limited to the user's triggers
+        transcripts (dict, optional): Timestamp -> transcript text (see utils.get_trigger_transcripts)
+        max_timestamps (int, optional): Timestamps listed per trigger. Defaults to 5.
+        max_snippets (int, optional): Transcript snippets quoted per trigger. Defaults to 2.
+        max_snippet_chars (int, optional): Truncation length of each snippet. Defaults to 120.
+
+    Returns:
+        str: One line per trigger with its count and timestamps, followed by quoted snippets
+    """
+    transcripts = transcripts or {}
+    timestamps_by_trigger = defaultdict(list)
+    for event in filtered_events:
+        timestamps_by_trigger[event['trigger']].append(event['timestamp'])
+
+    lines = []
+    for trigger, timestamps in timestamps_by_trigger.items():
+        shown = ", ".join(timestamps[:max_timestamps])
+        more = f" (+{len(timestamps) - max_timestamps} more)" if len(timestamps) > max_timestamps else ""
+        lines.append(f"- {trigger}: {len(timestamps)} detection(s) at {shown}{more}")
+
+        snippets = [(ts, transcripts[ts]) for ts in timestamps if transcripts.get(ts)][:max_snippets]
+        for timestamp, text in snippets:
+            if len(text) > max_snippet_chars:
+                text = text[:max_snippet_chars].rstrip() + "..."
+            lines.append(f'  {timestamp} transcript: "{text}"')
+    return "\n".join(lines)
+
+
+def choose_tier(filtered_events, transcripts=None, escalate=False):
+    """
+    Pick the model tier for an explanation. The reasoning tier is used when explicitly
+    requested or when the evidence is too thin for the fast model to be specific
+    (a single detection with no transcript around it).
+    """
+    if escalate:
+        return "reasoning"
+    transcripts = transcripts or {}
+    low_confidence = len(filtered_events) <= 1 and not any(
+        transcripts.get(event['timestamp']) for event in filtered_events
+    )
+    return "reasoning" if low_confidence else "fast"
+
+
+def get_model_response(video_title, user_triggers, digest="", tier="fast"):
+    """Start a streamed chat completion for the given tier."""
     endpoint = os.getenv("AZURE_MODELS_ENDPOINT")
-    model_name = "DeepSeek-R1"
+    config = MODEL_TIERS[tier]
 
     client = ChatCompletionsClient(
         endpoint=endpoint,
         credential=AzureKeyCredential(os.getenv("AZURE_AI_KEY")),
     )
 
+    prompt = f"Music video: {video_title}\nUser is sensitive to: {', '.join(user_triggers)}"
+    if digest:
+        prompt += f"\nDetected in the video:\n{digest}"
+
     response = client.complete(
         messages=[
-            SystemMessage(content="You are an assistant that helps users avoid disturbing content in videos by identifying psychological triggers based on user input. Keep the response short and to the point."),
-            UserMessage(content=f"Explain why a music video {video_title} may be distrubring for someone who is sensitive to seeing {', '.join(user_triggers)}")
+            SystemMessage(content=SYSTEM_PROMPT),
+            UserMessage(content=prompt)
         ],
-        max_tokens=500,
-        model=model_name,
+        max_tokens=config["max_tokens"],
+        model=config["model"],
         stream=True,
+        # Ask for a final usage chunk so token counts are real, not estimated from chunks
+        model_extras={"stream_options": {"include_usage": True}},
     )
     return response
 
 
+def report_llm_throttled(error):
+    """Pause the scheduler's LLM bucket when the models endpoint answered 429."""
+    if error.status_code == 429:
+        retry_after = error.response.headers.get("Retry-After") if error.response is not None else None
+        get_scheduler().report_throttled("llm", float(retry_after) if retry_after and retry_after.isdigit() else None)
+
+
+def get_deepseek_response(video_title, user_triggers, digest="", priority=INTERACTIVE, user=None):
+    """Start a streamed reasoning-tier completion once the quota scheduler admits it."""
+    get_scheduler().acquire("llm", priority, user)
+    try:
+        return get_model_response(video_title, user_triggers, digest, tier="reasoning")
+    except HttpResponseError as e:
+        report_llm_throttled(e)
+        raise
+
+
+def track_stream_stats(response, stats, start_time=None):
+    """
+    Pass a response stream through unchanged while recording time to first token and token counts.
+
+    Fills `stats` with time_to_first_token (seconds until the first content chunk), streamed_chunks,
+    prompt_tokens and completion_tokens (from the usage chunk, None if the service did not send one)
+    and total_time.
+    """
+    start_time = start_time or time.perf_counter()
+    stats.setdefault("time_to_first_token", None)
+    stats["streamed_chunks"] = 0
+    stats["prompt_tokens"] = None
+    stats["completion_tokens"] = None
+
+    for update in response:
+        usage = getattr(update, "usage", None)
+        if usage:
+            stats["prompt_tokens"] = usage.prompt_tokens
+            stats["completion_tokens"] = usage.completion_tokens
+        if update.choices and update.choices[0].delta and update.choices[0].delta.content:
+            if stats["time_to_first_token"] is None:
+                stats["time_to_first_token"] = time.perf_counter() - start_time
+            stats["streamed_chunks"] += 1
+        yield update
+
+    stats["total_time"] = time.perf_counter() - start_time
+
+
+def stream_explanation(video_title, user_triggers, filtered_events, transcripts=None, escalate=False, stats=None,
+                       priority=INTERACTIVE, user=None, cancelled=None, tier=None):
+    """
+    Stream an explanation of why a video may be disturbing, routed to the appropriate tier and
+    grounded in a digest of the detected events.
+
+    Args:
+        video_title (str): Video title
+        user_triggers (list): The user's triggers found in the video
+        filtered_events (list): The user's matching events from parse_json_triggers
+        transcripts (dict, optional): Timestamp -> transcript text for flagged shots
+        escalate (bool, optional): Force the reasoning tier
+        stats (dict, optional): Filled with tier, queue_wait, time_to_first_token, time_to_first_visible_token,
+            streamed_chunks, prompt_tokens, completion_tokens and total_time
+        priority (int or callable, optional): Scheduler priority class (INTERACTIVE or PREFETCH), or a
+            callable returning one that is re-evaluated while the call waits for admission
+        user (str, optional): User the explanation is for, used for fair queuing
+        cancelled (threading.Event, optional): Once set, no model call is made and an open stream is closed
+        tier (str, optional): Model tier to use, overriding choose_tier() and `escalate`
+
+    Yields:
+        str: Visible response text (reasoning blocks removed)
+    """
+    stats = stats if stats is not None else {}
+    tier = tier or choose_tier(filtered_events, transcripts, escalate)
+    stats["tier"] = tier
+    stats["time_to_first_visible_token"] = None
+
+    digest = build_trigger_digest(filtered_events, transcripts)
+    stats["queue_wait"] = get_scheduler().acquire("llm", priority, user)
+    # The explanation may have stopped being wanted while it waited for a slot
+    if cancelled is not None and cancelled.is_set():
+        return
+    # Latencies are measured from admission; time spent queued is reported as queue_wait
+    start_time = time.perf_counter()
+    try:
+        response = get_model_response(video_title, user_triggers, digest, tier)
+    except HttpResponseError as e:
+        report_llm_throttled(e)
+        raise
+    try:
+        for chunk in filter_thinking_stream(track_stream_stats(response, stats, start_time)):
+            if cancelled is not None and cancelled.is_set():
+                return
+            if chunk and stats["time_to_first_visible_token"] is None:
+                stats["time_to_first_visible_token"] = time.perf_counter() - start_time
+            yield chunk
+    finally:
+        # Closing the SDK stream drops the connection so the service stops generating
+        response.close()
+
+    print(f"Explanation stats for {video_title}: {stats}")
+
+
 def filter_thinking_stream(response):
     """Generator that filters <think>...</think> tags from the DeepSeek response stream"""
     inside_thinking = False
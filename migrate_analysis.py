@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+from archive_codec import ARCHIVE_EXTENSION, decode_archive, encode_archive, is_archive
+
+
+def migrate_directory(directory="video_analysis", keep_json=False, dry_run=False):
+    """
+    Convert every analyzer response JSON in `directory` to a compressed archive and point
+    processed_videos.json at the new files. Each archive is decoded and compared with the
+    original before the JSON is removed, so the conversion is verified lossless.
+
+    Args:
+        directory (str, optional): Analysis directory. Defaults to "video_analysis".
+        keep_json (bool, optional): Keep the original JSON files next to the archives
+        dry_run (bool, optional): Only report what would be converted
+
+    Returns:
+        dict: Mapping of old JSON file names to new archive file names
+    """
+    index_path = os.path.join(directory, "processed_videos.json")
+    renamed = {}
+    total_before = total_after = 0
+
+    for file_name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, file_name)
+        if not file_name.endswith(".json") or path == index_path or is_archive(path):
+            continue
+
+        with open(path, 'r') as file:
+            data = json.load(file)
+        # Only analyzer responses are archived (request_body.json etc. stay as they are)
+        if not isinstance(data, dict) or 'contents' not in (data.get('result') or {}):
+            continue
+
+        blob = encode_archive(data)
+        if decode_archive(blob) != data:
+            print(f"Skipping {file_name}: archive does not round-trip losslessly")
+            continue
+
+        archive_name = file_name[:-len(".json")] + ARCHIVE_EXTENSION
+        before = os.path.getsize(path)
+        total_before += before
+        total_after += len(blob)
+        print(f"{file_name}: {before} -> {len(blob)} bytes")
+        renamed[file_name] = archive_name
+
+        if dry_run:
+            continue
+        with open(os.path.join(directory, archive_name), 'wb') as file:
+            file.write(blob)
+        if not keep_json:
+            os.remove(path)
+
+    if renamed and not dry_run and os.path.exists(index_path):
+        with open(index_path, 'r') as file:
+            processed_videos = json.load(file)
+        for video in processed_videos:
+            video['json_file'] = renamed.get(video['json_file'], video['json_file'])
+        with open(index_path, 'w') as file:
+            json.dump(processed_videos, file, indent=4)
+
+    print(f"Converted {len(renamed)} files: {total_before} -> {total_after} bytes")
+    return renamed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert analyzer response JSON files to compressed archives.")
+    parser.add_argument("directory", nargs="?", default="video_analysis")
+    parser.add_argument("--keep-json", action="store_true", help="keep the original JSON files")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be converted")
+    args = parser.parse_args()
+    migrate_directory(args.directory, keep_json=args.keep_json, dry_run=args.dry_run)
@@ -0,0 +1,245 @@
+import threading
+import time
+from collections import defaultdict
+from http_client import get_transport
+
+
+# Priority classes, lower value is admitted first
+INTERACTIVE = 0
+PREFETCH = 1
+BACKFILL = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", PREFETCH: "prefetch", BACKFILL: "backfill"}
+
+# (requests per second, burst) per endpoint; endpoint names match http_client.ENDPOINT_TIMEOUTS
+ENDPOINT_RATES = {
+    "analyzer": (0.5, 3),
+    "poll": (2.0, 10),
+    "llm": (1.0, 5),
+    "default": (1.0, 5),
+}
+
+# Tokens a backfill request must leave in the bucket, so interactive users always have headroom
+BACKFILL_RESERVE = 1
+
+# Seconds between checks of a waiting request whose priority can change (see acquire())
+PRIORITY_RECHECK_INTERVAL = 0.5
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a request is not admitted within its timeout."""
+
+
+class TokenBucket:
+    """Token bucket rate limiter that can be paused after the endpoint answers 429."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    def _refill(self, now):
+        if now < self.paused_until:
+            self.updated = now
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now, reserve=0):
+        """Take one token if available. Returns 0 on success, otherwise the seconds to wait."""
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1 + reserve:
+            self.tokens -= 1
+            return 0
+        return (1 + reserve - self.tokens) / self.rate
+
+    def pause(self, until):
+        self.tokens = 0
+        self.paused_until = max(self.paused_until, until)
+
+
+class Ticket:
+    def __init__(self, endpoint, priority, user, seq):
+        self.endpoint = endpoint
+        self._priority = priority
+        self.user = user
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+
+    @property
+    def priority(self):
+        return self._priority() if callable(self._priority) else self._priority
+
+
+class QuotaScheduler:
+    """
+    Central admission control for calls to the shared Azure endpoints.
+
+    Each endpoint has a token bucket. Waiting requests are admitted in order of priority class
+    (interactive > prefetch > backfill); within a class, the user with the fewest admitted
+    requests goes first (fair queuing), then arrival order. A 429 from an endpoint pauses its
+    bucket for the Retry-After period. Queue depth and wait times are available from metrics().
+    """
+
+    def __init__(self, rates=None):
+        self.rates = rates or ENDPOINT_RATES
+        self._cond = threading.Condition()
+        self._buckets = {}
+        self._queues = defaultdict(list)
+        self._served = defaultdict(int)
+        self._seq = 0
+        self._wait_stats = defaultdict(lambda: {"admitted": 0, "total_wait": 0.0, "max_wait": 0.0})
+        self._throttled = defaultdict(int)
+
+    def _bucket(self, endpoint):
+        if endpoint not in self._buckets:
+            rate, capacity = self.rates.get(endpoint, self.rates["default"])
+            self._buckets[endpoint] = TokenBucket(rate, capacity)
+        return self._buckets[endpoint]
+
+    def _head(self, endpoint):
+        return min(
+            self._queues[endpoint],
+            key=lambda t: (t.priority, self._served[(endpoint, t.user)], t.seq),
+        )
+
+    def acquire(self, endpoint, priority=INTERACTIVE, user=None, timeout=None):
+        """
+        Block until a request to `endpoint` is admitted.
+
+        Args:
+            endpoint (str): Endpoint name, e.g. "analyzer", "poll" or "llm"
+            priority (int or callable, optional): INTERACTIVE, PREFETCH or BACKFILL. Defaults to
+                INTERACTIVE. A callable returning one of these is re-evaluated while the request
+                waits, so a queued request can be promoted (e.g. a prefetch the user has asked for).
+            user (str, optional): Who the request is for, used for fair queuing
+            timeout (float, optional): Give up after this many seconds
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            SchedulerTimeout: If the request was not admitted within `timeout`
+        """
+        with self._cond:
+            queue = self._queues[endpoint]
+            # A user joining the queue starts level with the least-served waiting user,
+            # so idle users do not build up credit they could use to starve others
+            waiting = [self._served[(endpoint, t.user)] for t in queue]
+            if waiting:
+                self._served[(endpoint, user)] = max(self._served[(endpoint, user)], min(waiting))
+
+            self._seq += 1
+            ticket = Ticket(endpoint, priority, user, self._seq)
+            queue.append(ticket)
+            self._cond.notify_all()
+            deadline = None if timeout is None else ticket.enqueued_at + timeout
+
+            while True:
+                now = time.monotonic()
+                wait = None
+                if self._head(endpoint) is ticket:
+                    bucket = self._bucket(endpoint)
+                    # The reserve must stay below capacity or backfill could never be admitted
+                    admitted_priority = ticket.priority
+                    reserve = min(BACKFILL_RESERVE, bucket.capacity - 1) if admitted_priority >= BACKFILL else 0
+                    wait = bucket.try_take(now, reserve)
+                    if wait == 0:
+                        queue.remove(ticket)
+                        self._served[(endpoint, user)] += 1
+                        waited = now - ticket.enqueued_at
+                        stats = self._wait_stats[(endpoint, admitted_priority)]
+                        stats["admitted"] += 1
+                        stats["total_wait"] += waited
+                        stats["max_wait"] = max(stats["max_wait"], waited)
+                        self._cond.notify_all()
+                        return waited
+
+                if wait is None and callable(priority):
+                    # Nothing wakes a waiting request when its priority changes, so check periodically
+                    wait = PRIORITY_RECHECK_INTERVAL
+                if deadline is not None:
+                    if now >= deadline:
+                        queue.remove(ticket)
+                        self._cond.notify_all()
+                        raise SchedulerTimeout(f"{PRIORITY_NAMES[ticket.priority]} request to {endpoint} not admitted within {timeout}s")
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    def report_throttled(self, endpoint, retry_after=None):
+        """Pause an endpoint's bucket after a 429, for Retry-After seconds or one refill period."""
+        with self._cond:
+            bucket = self._bucket(endpoint)
+            delay = retry_after if retry_after is not None else 1 / bucket.rate
+            bucket.pause(time.monotonic() + delay)
+            self._throttled[endpoint] += 1
+            self._cond.notify_all()
+
+    def metrics(self):
+        """
+        Current queue depth and cumulative wait times.
+
+        Returns:
+            dict: endpoint -> {"queue_depth": {priority: n}, "wait": {priority: {admitted, avg_wait,
+            max_wait}}, "throttled": n}
+        """
+        with self._cond:
+            endpoints = set(self._queues) | {endpoint for endpoint, _ in self._wait_stats} | set(self._throttled)
+            result = {}
+            for endpoint in endpoints:
+                depth = defaultdict(int)
+                for ticket in self._queues[endpoint]:
+                    depth[PRIORITY_NAMES[ticket.priority]] += 1
+                wait = {}
+                for (stats_endpoint, priority), stats in self._wait_stats.items():
+                    if stats_endpoint == endpoint and stats["admitted"]:
+                        wait[PRIORITY_NAMES[priority]] = {
+                            "admitted": stats["admitted"],
+                            "avg_wait": stats["total_wait"] / stats["admitted"],
+                            "max_wait": stats["max_wait"],
+                        }
+                result[endpoint] = {"queue_depth": dict(depth), "wait": wait, "throttled": self._throttled[endpoint]}
+            return result
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler, wired to receive 429s seen by the shared transport."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = QuotaScheduler()
+            get_transport().add_throttle_listener(_scheduler.report_throttled)
+        return _scheduler
+
+
+def configure_scheduler(rates):
+    """
+    Override endpoint rates of the process-wide scheduler, e.g. to give a second process
+    sharing the same Azure quota a smaller share. Call at start-up, before any request.
+    """
+    scheduler = get_scheduler()
+    with scheduler._cond:
+        scheduler.rates = {**scheduler.rates, **rates}
+        for endpoint in rates:
+            scheduler._buckets.pop(endpoint, None)
+
+
+def scheduled_request(method, url, endpoint, priority=INTERACTIVE, user=None, **kwargs):
+    """
+    Send a request through the shared transport with every attempt, retries included,
+    admitted by the scheduler. A 429 pauses the endpoint's bucket, so throttled retries
+    wait in the priority queue instead of hitting the endpoint again.
+    """
+    scheduler = get_scheduler()
+    return get_transport().request(
+        method, url, endpoint=endpoint,
+        before_attempt=lambda: scheduler.acquire(endpoint, priority, user),
+        **kwargs
+    )
@@ -0,0 +1,51 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeEndpoint:
+    """Local HTTP endpoint answering with a scripted list of status codes (200 once exhausted)."""
+
+    def __init__(self):
+        self.statuses = []
+        self.retry_after = None
+        self.hits = []
+        self.lock = threading.Lock()
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                with endpoint.lock:
+                    endpoint.hits.append(self.path)
+                    status = endpoint.statuses.pop(0) if endpoint.statuses else 200
+                self.send_response(status)
+                if status == 429 and endpoint.retry_after is not None:
+                    self.send_header("Retry-After", str(endpoint.retry_after))
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            do_GET = do_POST = do_PUT = _respond
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_endpoint():
+    endpoint = FakeEndpoint()
+    yield endpoint
+    endpoint.close()
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import shutil
+import api
+from aiohttp.test_utils import TestClient, TestServer
+
+ANALYSIS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "video_analysis")
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def with_client(tmp_path, check):
+    for name in os.listdir(ANALYSIS_DIR):
+        shutil.copy(os.path.join(ANALYSIS_DIR, name), tmp_path)
+    async with TestClient(TestServer(api.create_app(str(tmp_path)))) as client:
+        return await check(client)
+
+
+def test_batch_ids_must_be_a_list_of_strings(tmp_path):
+    async def check(client):
+        statuses = []
+        for body in ('{"ids": "abc"}', '{"ids": [1]}', '[1]', 'nope'):
+            statuses.append((await client.post("/videos/triggers", data=body)).status)
+        ok = await client.post("/videos/triggers", json={"ids": ["unknown"]})
+        return statuses, ok.status, await ok.json()
+
+    statuses, status, body = run(with_client(tmp_path, check))
+    assert statuses == [400] * 4
+    assert status == 200 and body["missing"] == ["unknown"]
+
+
+def test_verdicts_echo_normalized_triggers(tmp_path):
+    async def check(client):
+        first = await (await client.get("/verdicts?triggers=SPIDERS,Needles")).json()
+        second = await (await client.get("/verdicts?triggers=needles,spiders")).json()
+        return first["triggers"], second["triggers"]
+
+    assert run(with_client(tmp_path, check)) == (["needles", "spiders"], ["needles", "spiders"])
+
+
+def flagged_video(client):
+    catalog = client.server.app["catalog"]
+    video_id = next(video_id for video_id, video in catalog.videos.items() if video["triggers"])
+    return video_id, catalog.videos[video_id]["triggers"][0]
+
+
+def test_explanation_streams_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(api, "stream_explanation", lambda *args, **kwargs: iter(["Spiders ", "appear."]))
+
+    async def check(client):
+        video_id, trigger = flagged_video(client)
+        response = await client.get(f"/videos/{video_id}/explanation?triggers={trigger}")
+        return response.status, await response.text()
+
+    status, body = run(with_client(tmp_path, check))
+    assert status == 200
+    assert body == 'data: "Spiders "\n\ndata: "appear."\n\nevent: done\ndata: {}\n\n'
+
+
+def test_failed_explanation_sends_error_event(tmp_path, monkeypatch):
+    def failing(*args, **kwargs):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(api, "stream_explanation", failing)
+
+    async def check(client):
+        video_id, trigger = flagged_video(client)
+        response = await client.get(f"/videos/{video_id}/explanation?triggers={trigger}")
+        return await response.text()
+
+    assert run(with_client(tmp_path, check)) == 'event: error\ndata: {"error": "model unavailable"}\n\n'
+
+
+def test_reload_skips_missing_analysis_files(tmp_path):
+    for name in os.listdir(ANALYSIS_DIR):
+        shutil.copy(os.path.join(ANALYSIS_DIR, name), tmp_path)
+    missing = "The Cardigans - My Favourite Game.json"
+    os.remove(tmp_path / missing)
+    catalog = api.Catalog(str(tmp_path))
+    assert catalog.reload_if_changed()
+    count = len(catalog.videos)
+    assert catalog.missing_files == [str(tmp_path / missing)]
+
+    # Picked up once the file appears, without touching processed_videos.json
+    shutil.copy(os.path.join(ANALYSIS_DIR, missing), tmp_path)
+    assert catalog.reload_if_changed()
+    assert len(catalog.videos) == count + 1
+    assert not catalog.reload_if_changed()
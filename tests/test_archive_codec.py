@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import pytest
+from archive_codec import ARCHIVE_EXTENSION, decode_archive, encode_archive, is_archive, save_archive
+from migrate_analysis import migrate_directory
+from utils import parse_json_triggers
+
+ANALYSIS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "video_analysis")
+RESPONSE = "The Cardigans - My Favourite Game.json"
+
+
+def load_response(name=RESPONSE):
+    with open(os.path.join(ANALYSIS_DIR, name), 'r') as file:
+        return json.load(file)
+
+
+def test_archive_round_trip_is_lossless():
+    data = load_response()
+    blob = encode_archive(data)
+    assert decode_archive(blob) == data
+    assert len(blob) < len(json.dumps(data))
+
+
+def test_index_parse_matches_json(tmp_path):
+    archive_path = tmp_path / ("response" + ARCHIVE_EXTENSION)
+    save_archive(load_response(), str(archive_path))
+    assert is_archive(str(archive_path))
+    assert parse_json_triggers(str(archive_path)) == parse_json_triggers(os.path.join(ANALYSIS_DIR, RESPONSE))
+
+
+def test_decode_rejects_other_files():
+    with pytest.raises(ValueError):
+        decode_archive(b"{}" * 8)
+
+
+@pytest.mark.parametrize("keep_json", [False, True])
+def test_migrate_directory(tmp_path, keep_json):
+    for name in (RESPONSE, "request_body.json", "processed_videos.json"):
+        shutil.copy(os.path.join(ANALYSIS_DIR, name), tmp_path)
+    with open(tmp_path / "processed_videos.json", 'r') as file:
+        listed = [video for video in json.load(file) if video['json_file'] == RESPONSE]
+
+    renamed = migrate_directory(str(tmp_path), keep_json=keep_json)
+
+    archive_name = RESPONSE[:-len(".json")] + ARCHIVE_EXTENSION
+    assert renamed == {RESPONSE: archive_name}
+    with open(tmp_path / archive_name, 'rb') as file:
+        assert decode_archive(file.read()) == load_response()
+    assert (tmp_path / RESPONSE).exists() == keep_json
+    # Non-response JSON is left alone
+    assert (tmp_path / "request_body.json").exists()
+
+    with open(tmp_path / "processed_videos.json", 'r') as file:
+        processed_videos = json.load(file)
+    assert listed and all(video['json_file'] != RESPONSE for video in processed_videos)
+    assert [video['url'] for video in processed_videos if video['json_file'] == archive_name] == \
+        [video['url'] for video in listed]
+
+    # Migrating again leaves the index pointing at the archive
+    migrate_directory(str(tmp_path), keep_json=keep_json)
+    with open(tmp_path / "processed_videos.json", 'r') as file:
+        assert json.load(file) == processed_videos
@@ -0,0 +1,77 @@
+import threading
+import pytest
+from explanation_prefetch import ExplanationPrefetcher, explanation_key
+
+
+def test_cancel_reaches_producer_before_first_chunk():
+    prefetcher = ExplanationPrefetcher(max_workers=1)
+    started, seen = threading.Event(), []
+
+    def producer(entry):
+        started.set()
+        # Stands in for stream_explanation blocking in the scheduler queue
+        entry.cancelled.wait(5)
+        seen.append(entry.cancelled.is_set())
+        return iter(["never shown"])
+
+    key = explanation_key("https://example.com/v", ["Spiders"])
+    assert prefetcher.submit(key, "alice", producer)
+    entry = prefetcher._entries[key]
+    started.wait(5)
+    prefetcher.cancel_owner("alice")
+    entry.future.result(5)
+
+    assert seen == [True]
+    assert prefetcher.get_text(key) is None
+
+
+def test_interactive_request_keeps_running_after_cancel_owner():
+    prefetcher = ExplanationPrefetcher()
+    key = explanation_key("https://example.com/v", ["Spiders"])
+    assert prefetcher.submit(key, "alice", lambda entry: iter(["a", "b"]), speculative=False)
+    prefetcher.cancel_owner("alice")
+    assert "".join(prefetcher.stream(key)) == "ab"
+
+
+def failing(entry):
+    raise RuntimeError("429 Too Many Requests")
+    yield
+
+
+def test_failed_request_is_reported_to_the_next_reader():
+    prefetcher = ExplanationPrefetcher()
+    key = explanation_key("https://example.com/v", ["Spiders"])
+    assert prefetcher.submit(key, "alice", failing, speculative=False)
+    prefetcher._entries[key].future.result(5)
+
+    # Kept (and not restarted by a prefetch) until a reader has seen the error
+    assert prefetcher.submit(key, "alice", lambda entry: iter(["late"]))
+    assert prefetcher.get_text(key) is None
+    with pytest.raises(RuntimeError):
+        list(prefetcher.stream(key))
+    assert prefetcher.stream(key) is None
+
+
+def test_failed_prefetch_is_dropped():
+    prefetcher = ExplanationPrefetcher()
+    key = explanation_key("https://example.com/v", ["Spiders"])
+    assert prefetcher.submit(key, "alice", failing)
+    prefetcher._entries[key].future.result(5)
+    assert prefetcher.stream(key) is None
+
+
+def test_producer_sees_promotion():
+    prefetcher = ExplanationPrefetcher(max_workers=1)
+    release, priorities = threading.Event(), []
+
+    def producer(entry):
+        release.wait(5)
+        priorities.append(entry.speculative)
+        return iter(["ok"])
+
+    key = explanation_key("https://example.com/v", ["Spiders"])
+    assert prefetcher.submit(key, "alice", producer)
+    assert prefetcher.submit(key, "alice", producer, speculative=False)
+    release.set()
+    assert "".join(prefetcher.stream(key)) == "ok"
+    assert priorities == [False]
@@ -0,0 +1,84 @@
+import socket
+import threading
+import time
+import pytest
+import requests
+from http_client import CircuitBreaker, HttpTransport
+
+
+def test_half_open_trial_released_on_429(fake_endpoint):
+    transport = HttpTransport(max_retries=0, failure_threshold=1, reset_timeout=0.05)
+    breaker = transport.breaker_for(fake_endpoint.url)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(0.06)
+
+    fake_endpoint.statuses = [429]
+    response = transport.get(fake_endpoint.url + "/throttled")
+    assert response.status_code == 429
+    assert breaker.state == "half-open"
+    assert not breaker.trial_in_flight
+
+    # The next call gets the trial slot and closes the circuit
+    assert transport.get(fake_endpoint.url + "/ok").status_code == 200
+    assert breaker.state == "closed"
+
+
+def test_429_does_not_open_circuit(fake_endpoint):
+    transport = HttpTransport(max_retries=0, failure_threshold=2)
+    fake_endpoint.statuses = [429] * 5
+    for _ in range(5):
+        assert transport.get(fake_endpoint.url).status_code == 429
+    assert transport.breaker_for(fake_endpoint.url).state == "closed"
+
+
+def test_failures_open_circuit():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_post_not_retried_after_connection_dropped():
+    # Reads the request, then closes the connection without answering
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    accepted = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            accepted.append(conn.recv(65536))
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    url = f"http://127.0.0.1:{server.getsockname()[1]}/analyze"
+    transport = HttpTransport(max_retries=2, backoff_base=0)
+    try:
+        with pytest.raises(requests.ConnectionError):
+            transport.post(url, json={})
+        assert len(accepted) == 1
+
+        with pytest.raises(requests.ConnectionError):
+            transport.get(url)
+        assert len(accepted) == 4
+    finally:
+        server.close()
+
+
+def test_post_retried_when_connection_refused():
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    transport = HttpTransport(max_retries=2, backoff_base=0, failure_threshold=10)
+    attempts = []
+    with pytest.raises(requests.ConnectionError):
+        transport.post(f"http://127.0.0.1:{port}/analyze", before_attempt=lambda: attempts.append(1))
+    assert len(attempts) == 3
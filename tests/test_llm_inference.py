@@ -0,0 +1,60 @@
+import time
+from types import SimpleNamespace
+import llm_inference
+
+
+class FakeStream:
+    def __init__(self, texts, usage=None):
+        self.updates = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+            for text in texts
+        ]
+        if usage:
+            self.updates.append(SimpleNamespace(choices=[], usage=SimpleNamespace(**usage)))
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.updates)
+
+    def close(self):
+        self.closed = True
+
+
+class SlowScheduler:
+    def __init__(self, delay):
+        self.delay = delay
+        self.admitted = []
+
+    def acquire(self, endpoint, priority=0, user=None, timeout=None):
+        time.sleep(self.delay)
+        self.admitted.append((endpoint, priority, user))
+        return self.delay
+
+
+EVENTS = [{'trigger': 'Spiders', 'timestamp': '00:05'}, {'trigger': 'Spiders', 'timestamp': '00:20'}]
+
+
+def test_latency_stats_exclude_queue_wait(monkeypatch):
+    stream = FakeStream(["Spiders ", "appear."], usage={'prompt_tokens': 40, 'completion_tokens': 3})
+    monkeypatch.setattr(llm_inference, "get_scheduler", lambda: SlowScheduler(0.3))
+    monkeypatch.setattr(llm_inference, "get_model_response", lambda *args: stream)
+
+    stats = {}
+    text = "".join(llm_inference.stream_explanation("Video", ["Spiders"], EVENTS, stats=stats))
+
+    assert text == "Spiders appear."
+    assert stats["queue_wait"] >= 0.3
+    assert stats["total_time"] < 0.3
+    assert stats["time_to_first_token"] < 0.3
+    assert stats["streamed_chunks"] == 2
+    assert stats["completion_tokens"] == 3
+    assert stream.closed
+
+
+def test_deepseek_response_is_admitted_by_the_scheduler(monkeypatch):
+    scheduler = SlowScheduler(0)
+    monkeypatch.setattr(llm_inference, "get_scheduler", lambda: scheduler)
+    monkeypatch.setattr(llm_inference, "get_model_response", lambda *args, **kwargs: FakeStream(["ok"]))
+
+    llm_inference.get_deepseek_response("Video", ["Spiders"], user="alice")
+    assert scheduler.admitted == [("llm", llm_inference.INTERACTIVE, "alice")]
@@ -0,0 +1,87 @@
+import threading
+import time
+from http_client import HttpTransport
+from quota_scheduler import QuotaScheduler, INTERACTIVE, PREFETCH, BACKFILL
+
+
+def drain(scheduler, endpoint, tickets):
+    """Queue `tickets` as (priority, user) behind an empty bucket and return their admission order."""
+    order = []
+    lock = threading.Lock()
+
+    def worker(priority, user, label):
+        scheduler.acquire(endpoint, priority, user, timeout=10)
+        with lock:
+            order.append(label)
+
+    threads = []
+    for i, (priority, user) in enumerate(tickets):
+        thread = threading.Thread(target=worker, args=(priority, user, (priority, user, i)))
+        thread.start()
+        threads.append(thread)
+        # Make sure arrival order matches the list
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    return order
+
+
+def test_priority_order():
+    scheduler = QuotaScheduler({"default": (20.0, 1)})
+    scheduler.acquire("default")  # empty the bucket so the tickets below queue up
+    order = drain(scheduler, "default", [(BACKFILL, "a"), (PREFETCH, "a"), (INTERACTIVE, "a")])
+    assert [priority for priority, _, _ in order] == [INTERACTIVE, PREFETCH, BACKFILL]
+
+
+def test_fair_alternation_between_users():
+    scheduler = QuotaScheduler({"default": (20.0, 1)})
+    scheduler.acquire("default")
+    order = drain(scheduler, "default", [(PREFETCH, "a")] * 4 + [(PREFETCH, "b")] * 4)
+    users = [user for _, user, _ in order]
+    assert users[:4] in (["a", "b", "a", "b"], ["b", "a", "b", "a"])
+
+
+def test_throttled_retry_waits_for_bucket_pause(fake_endpoint):
+    scheduler = QuotaScheduler({"default": (50.0, 5)})
+    transport = HttpTransport(max_retries=2)
+    transport.add_throttle_listener(scheduler.report_throttled)
+    fake_endpoint.statuses = [429]
+    fake_endpoint.retry_after = 1
+
+    start = time.monotonic()
+    response = transport.get(
+        fake_endpoint.url, before_attempt=lambda: scheduler.acquire("default", INTERACTIVE, "a", timeout=5),
+    )
+    elapsed = time.monotonic() - start
+
+    assert response.status_code == 200
+    assert len(fake_endpoint.hits) == 2
+    # The retry was held back by the paused bucket, not sent straight away
+    assert elapsed >= 0.9
+    metrics = scheduler.metrics()["default"]
+    assert metrics["throttled"] == 1
+    assert metrics["wait"]["interactive"]["admitted"] == 2
+
+
+def test_queued_request_can_be_promoted():
+    scheduler = QuotaScheduler({"default": (5.0, 1)})
+    scheduler.acquire("default")
+    promoted = threading.Event()
+    order = []
+
+    def worker(priority, label):
+        scheduler.acquire("default", priority, label, timeout=10)
+        order.append(label)
+
+    threads = [threading.Thread(target=worker, args=(PREFETCH, f"other{i}")) for i in range(2)]
+    # A prefetch queued last, which the user then asks for
+    threads.append(threading.Thread(
+        target=worker, args=(lambda: INTERACTIVE if promoted.is_set() else PREFETCH, "asked"),
+    ))
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    promoted.set()
+    for thread in threads:
+        thread.join()
+    assert order[0] == "asked"
@@ -0,0 +1,61 @@
+from user_library import UserLibrary
+
+SPIDERS = [{'trigger': 'Spiders', 'timestamp': '00:05'}]
+NEEDLES = [{'trigger': 'Needles', 'timestamp': '00:10'}]
+
+
+def make_library():
+    library = UserLibrary(":memory:")
+    library.ensure_user("alice", ["Spiders", "Needles"])
+    library.ingest_video("spiders", "Spiders", "spiders.swz", SPIDERS)
+    library.ingest_video("needles", "Needles", "needles.swz", NEEDLES)
+    library.ingest_video("both", "Both", "both.swz", SPIDERS + NEEDLES)
+    library.ingest_video("safe", "Safe", "safe.swz", [])
+    return library
+
+
+def test_toggle_only_rewrites_rows_containing_the_trigger():
+    library = make_library()
+    before = library.get_user_view("alice")
+    assert set(library.get_flagged_videos("alice")) == {"spiders", "needles", "both"}
+
+    written = []
+    library._conn.set_trace_callback(lambda sql: written.append(sql) if "user_video_view" in sql else None)
+    library.toggle_trigger("alice", "Spiders", False)
+    library._conn.set_trace_callback(None)
+
+    # Only the two videos containing spiders get a new view row
+    assert len(written) == 2
+    after = library.get_user_view("alice")
+    assert after["spiders"] == {'flagged': False, 'matched_triggers': [], 'matched_events': []}
+    assert after["both"]["matched_triggers"] == ["Needles"]
+    assert after["needles"] == before["needles"]
+    assert after["safe"] == before["safe"]
+    assert library.get_selected_triggers("alice") == ["Needles"]
+
+
+def test_reingest_with_changed_triggers():
+    library = make_library()
+    library.set_selected_triggers("alice", ["Needles"])
+    assert not library.get_user_view("alice")["spiders"]["flagged"]
+
+    # A re-analysis now finds needles in the video
+    library.ingest_video("spiders", "Spiders", "spiders.swz", NEEDLES)
+    assert library.get_user_view("alice")["spiders"]["matched_triggers"] == ["Needles"]
+
+    # The trigger index follows the new events: toggling spiders no longer touches the video
+    library.toggle_trigger("alice", "Spiders", True)
+    assert library.get_user_view("alice")["spiders"]["matched_triggers"] == ["Needles"]
+    assert library.video_urls() == {"spiders", "needles", "both", "safe"}
+
+
+def test_ensure_user_after_videos_exist():
+    library = make_library()
+    library.ensure_user("bob", ["Needles"])
+    view = library.get_user_view("bob")
+    assert set(view) == {"spiders", "needles", "both", "safe"}
+    assert set(library.get_flagged_videos("bob")) == {"needles", "both"}
+
+    # An existing profile keeps its selection
+    library.ensure_user("alice", ["Spiders"])
+    assert library.get_selected_triggers("alice") == ["Spiders", "Needles"]
@@ -0,0 +1,196 @@
+import json
+import os
+import sqlite3
+import threading
+
+
+DEFAULT_DB_PATH = os.getenv("SAFEWATCH_DB_PATH", "user_library.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_profiles (
+    user TEXT PRIMARY KEY,
+    avatar TEXT,
+    triggers TEXT NOT NULL,
+    selected_triggers TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS videos (
+    url TEXT PRIMARY KEY,
+    title TEXT,
+    json_file TEXT,
+    events TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS video_triggers (
+    trigger TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (trigger, url)
+);
+CREATE TABLE IF NOT EXISTS user_video_view (
+    user TEXT NOT NULL,
+    url TEXT NOT NULL,
+    flagged INTEGER NOT NULL,
+    matched_triggers TEXT NOT NULL,
+    matched_events TEXT NOT NULL,
+    PRIMARY KEY (user, url)
+);
+"""
+
+
+class UserLibrary:
+    """
+    Persisted user profiles with materialized per-user views of the video library.
+
+    For every (user, video) pair the view stores whether the video is flagged, the user's
+    triggers it contains and the matching events. Views are maintained incrementally:
+    ingesting a video computes one row per user, and toggling a trigger only rewrites the
+    rows of videos that contain that trigger (found through the video_triggers index).
+    Reading a user's library is a single indexed lookup with no filtering.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        # In-memory copy of the views of users that have been opened, kept in sync on every write
+        self._views = {}
+        # URLs of ingested videos, loaded on first use and kept in sync by ingest_video()
+        self._video_urls = None
+
+    # Profiles
+
+    def ensure_user(self, user, triggers, avatar=None):
+        """Create a profile with all `triggers` selected, unless the user already exists."""
+        with self._lock, self._conn:
+            created = self._conn.execute(
+                "INSERT OR IGNORE INTO user_profiles (user, avatar, triggers, selected_triggers) VALUES (?, ?, ?, ?)",
+                (user, avatar, json.dumps(triggers), json.dumps(triggers)),
+            ).rowcount
+            if created:
+                videos = self._conn.execute("SELECT url, events FROM videos").fetchall()
+                for url, events in videos:
+                    self._write_view_row(user, url, json.loads(events), set(triggers))
+
+    def get_triggers(self, user):
+        with self._lock:
+            row = self._conn.execute("SELECT triggers FROM user_profiles WHERE user = ?", (user,)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def get_selected_triggers(self, user):
+        with self._lock:
+            row = self._conn.execute("SELECT selected_triggers FROM user_profiles WHERE user = ?", (user,)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def set_selected_triggers(self, user, selected_triggers):
+        """Persist a new trigger selection, toggling only the triggers that changed."""
+        # Held across the read and the toggles so concurrent sessions cannot interleave a stale diff
+        with self._lock:
+            current = set(self.get_selected_triggers(user))
+            selected = set(selected_triggers)
+            for trigger in selected - current:
+                self.toggle_trigger(user, trigger, True)
+            for trigger in current - selected:
+                self.toggle_trigger(user, trigger, False)
+
+    def toggle_trigger(self, user, trigger, enabled):
+        """Select or deselect one trigger and update only the view rows of videos containing it."""
+        with self._lock, self._conn:
+            selected = json.loads(self._conn.execute(
+                "SELECT selected_triggers FROM user_profiles WHERE user = ?", (user,)
+            ).fetchone()[0])
+            if enabled and trigger not in selected:
+                selected.append(trigger)
+            elif not enabled and trigger in selected:
+                selected.remove(trigger)
+            else:
+                return
+            self._conn.execute(
+                "UPDATE user_profiles SET selected_triggers = ? WHERE user = ?", (json.dumps(selected), user)
+            )
+
+            affected = self._conn.execute(
+                "SELECT v.url, v.events FROM video_triggers t JOIN videos v ON v.url = t.url WHERE t.trigger = ?",
+                (trigger,),
+            ).fetchall()
+            for url, events in affected:
+                self._write_view_row(user, url, json.loads(events), set(selected))
+
+    # Videos
+
+    def _known_urls(self):
+        if self._video_urls is None:
+            self._video_urls = {url for (url,) in self._conn.execute("SELECT url FROM videos")}
+        return self._video_urls
+
+    def video_urls(self):
+        """Return the set of ingested video URLs (read from the database once per process)."""
+        with self._lock:
+            return set(self._known_urls())
+
+    def has_video(self, url):
+        with self._lock:
+            return url in self._known_urls()
+
+    def ingest_video(self, url, title, json_file, filtered_events):
+        """Add (or replace) a video and compute its view row for every user."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO videos (url, title, json_file, events) VALUES (?, ?, ?, ?)",
+                (url, title, json_file, json.dumps(filtered_events)),
+            )
+            self._conn.execute("DELETE FROM video_triggers WHERE url = ?", (url,))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO video_triggers (trigger, url) VALUES (?, ?)",
+                [(trigger, url) for trigger in {event['trigger'] for event in filtered_events}],
+            )
+            users = self._conn.execute("SELECT user, selected_triggers FROM user_profiles").fetchall()
+            for user, selected in users:
+                self._write_view_row(user, url, filtered_events, set(json.loads(selected)))
+            if self._video_urls is not None:
+                self._video_urls.add(url)
+
+    def _write_view_row(self, user, url, filtered_events, selected):
+        matched_events = [event for event in filtered_events if event['trigger'] in selected]
+        matched_triggers = sorted({event['trigger'] for event in matched_events})
+        self._conn.execute(
+            "INSERT OR REPLACE INTO user_video_view (user, url, flagged, matched_triggers, matched_events) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (user, url, int(bool(matched_triggers)), json.dumps(matched_triggers), json.dumps(matched_events)),
+        )
+        if user in self._views:
+            self._views[user][url] = {
+                'flagged': bool(matched_triggers),
+                'matched_triggers': matched_triggers,
+                'matched_events': matched_events,
+            }
+
+    # Views
+
+    def get_user_view(self, user):
+        """
+        Return the materialized view for a user. The view is read from the database the first
+        time a user is opened in this process and served from memory afterwards.
+
+        Returns:
+            dict: video URL -> {'flagged', 'matched_triggers', 'matched_events'}
+        """
+        with self._lock:
+            if user not in self._views:
+                rows = self._conn.execute(
+                    "SELECT url, flagged, matched_triggers, matched_events FROM user_video_view WHERE user = ?", (user,)
+                ).fetchall()
+                self._views[user] = {
+                    url: {
+                        'flagged': bool(flagged),
+                        'matched_triggers': json.loads(matched_triggers),
+                        'matched_events': json.loads(matched_events),
+                    }
+                    for url, flagged, matched_triggers, matched_events in rows
+                }
+            # Shallow copy so callers can iterate while other sessions update the view
+            return dict(self._views[user])
+
+    def get_flagged_videos(self, user):
+        return [url for url, row in self.get_user_view(user).items() if row['flagged']]
+
+    def get_safe_videos(self, user):
+        return [url for url, row in self.get_user_view(user).items() if not row['flagged']]
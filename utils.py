@@ -4,6 +4,9 @@ from collections import defaultdict
 import os
 import streamlit as st
 import requests
+from functools import lru_cache
+from http_client import get_transport, response_json
+from archive_codec import is_archive, load_archive, load_archive_index, project_shots
 
 
 def time_to_seconds(time_str):
@@ -27,53 +30,57 @@ def parse_json_triggers(file_path):
     Filter out duplicate triggers that occur within 5 seconds of each other.
     Exclude any triggers that happen at 00:00 as these are likely bugs.
     Format trigger names by replacing underscores with spaces and capitalizing first letter.
+    Compressed archives are read through their index only, without decoding the full response.
     
     Args:
-        file_path: Path to the JSON file
+        file_path: Path to the JSON file or compressed analysis archive
         
     Returns:
         - Dictionary of unique event types and their timestamps
         - List of all unique event timestamps with their trigger types
     """
+    if is_archive(file_path):
+        return triggers_from_shots(load_archive_index(file_path)['shots'])
+
     # Read and parse JSON file
     with open(file_path, 'r') as file:
         data = json.load(file)
-    
+
+    return extract_triggers(data)
+
+
+def extract_triggers(data):
+    """
+    Extract trigger events from an already loaded Content Understanding response.
+    See parse_json_triggers for the filtering rules and return values.
+    """
+    return triggers_from_shots(project_shots(data))
+
+
+def triggers_from_shots(shots):
+    """
+    Build trigger events from projected shots (see archive_codec.project_shots).
+    See parse_json_triggers for the filtering rules and return values.
+    """
     raw_triggers = []
     
-    # Process each content entry
-    for content in data['result']['contents']:
-        # Extract start time from markdown using regex
-        markdown = content['markdown']
-        time_range_match = re.search(r'# Shot (\d+:\d+)\.\d+ => \d+:\d+\.\d+', markdown)
-        
-        if not time_range_match:
-            continue
-            
-        # Round to seconds by capturing only minutes and seconds
-        start_time = time_range_match.group(1)
-        
+    # Process each shot
+    for start_time, _, _, true_fields, *_ in shots:
         # Skip if the timestamp is 00:00 (likely a bug)
         if start_time == "00:00":
             continue
         
-        # Check all fields for boolean values set to true
-        for field_name, field_value in content['fields'].items():
-            # Skip the timestamps field
-            if field_name == 'timestamps':
-                continue
-                
-            # Check if this field has valueBoolean set to true
-            if field_value.get('type') == 'boolean' and field_value.get('valueBoolean') == True:
-                # Format the trigger name
-                formatted_trigger = format_trigger_name(field_name)
-                
-                raw_triggers.append({
-                    'trigger': formatted_trigger,
-                    'original_trigger': field_name,
-                    'timestamp': start_time,
-                    'seconds': time_to_seconds(start_time)
-                })
+        # Check all boolean fields set to true
+        for field_name in true_fields:
+            # Format the trigger name
+            formatted_trigger = format_trigger_name(field_name)
+            
+            raw_triggers.append({
+                'trigger': formatted_trigger,
+                'original_trigger': field_name,
+                'timestamp': start_time,
+                'seconds': time_to_seconds(start_time)
+            })
     
     # Sort triggers by timestamp
     raw_triggers.sort(key=lambda x: x['seconds'])
@@ -104,6 +111,68 @@ def parse_json_triggers(file_path):
     return unique_triggers, filtered_triggers
 
 
+def get_trigger_transcripts(file_path):
+    """
+    Get the transcript text of every shot that has at least one trigger, keyed by the
+    shot start time (MM:SS, as in the parsed events). Archives are read through their index only.
+
+    Args:
+        file_path: Path to the JSON file or compressed analysis archive
+
+    Returns:
+        dict: Timestamp -> transcript text, for shots with a non-empty transcript
+    """
+    if is_archive(file_path):
+        shots = load_archive_index(file_path)['shots']
+    else:
+        with open(file_path, 'r') as file:
+            shots = project_shots(json.load(file))
+
+    transcripts = {}
+    for shot in shots:
+        # Archives written before transcripts were projected have no fifth element
+        transcript = shot[4] if len(shot) > 4 else ""
+        if transcript:
+            transcripts.setdefault(shot[0], transcript)
+    return transcripts
+
+
+def compare_trigger_events(baseline_events, new_events, tolerance=5):
+    """
+    Compare the filtered events of two analyses of the same video, e.g. a re-run with a
+    smaller download profile against the bundled result in video_analysis/.
+    An event matches if the same trigger occurs within `tolerance` seconds.
+
+    Args:
+        baseline_events (list): Filtered events from the reference analysis
+        new_events (list): Filtered events from the new analysis
+        tolerance (int, optional): Maximum timestamp difference in seconds. Defaults to 5.
+
+    Returns:
+        dict: matched, missed and extra event counts plus recall, precision and
+        whether both analyses flag the same set of triggers
+    """
+    unmatched = [(event['trigger'], time_to_seconds(event['timestamp'])) for event in new_events]
+    matched = 0
+
+    for event in baseline_events:
+        seconds = time_to_seconds(event['timestamp'])
+        for idx, (trigger, new_seconds) in enumerate(unmatched):
+            if trigger == event['trigger'] and abs(new_seconds - seconds) <= tolerance:
+                matched += 1
+                del unmatched[idx]
+                break
+
+    return {
+        'matched': matched,
+        'missed': len(baseline_events) - matched,
+        'extra': len(unmatched),
+        'recall': matched / len(baseline_events) if baseline_events else 1.0,
+        'precision': matched / len(new_events) if new_events else 1.0,
+        'same_triggers': {e['trigger'] for e in baseline_events} == {e['trigger'] for e in new_events},
+    }
+
+
 def load_css(file_name):
     with open("style.css") as css_file:
         css = css_file.read()
@@ -116,36 +185,72 @@ def load_css(file_name):
     """)
 
 
+YOUTUBE_ID_PATTERN = re.compile(
+    r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])'
+)
+
+
+def extract_youtube_id(url):
+    """Return the 11-character YouTube video id from a URL, or None if it is not a YouTube video URL"""
+    match = YOUTUBE_ID_PATTERN.search(url or '')
+    return match.group(1) if match else None
+
+
+@lru_cache(maxsize=512)
+def get_youtube_metadata(video_id, timeout=5):
+    """
+    Probe YouTube's oEmbed endpoint for a video id. Results are cached per id;
+    network failures raise and are therefore not cached.
+
+    Args:
+        video_id (str): The YouTube video id
+        timeout (int, optional): Read timeout in seconds. Defaults to 5.
+
+    Returns:
+        dict: oEmbed metadata (title, author_name, ...), an empty dict for videos that
+        exist but cannot be embedded, or None if the video does not exist
+    """
+    response = get_transport().get(
+        "https://www.youtube.com/oembed",
+        endpoint="metadata",
+        timeout=(3, timeout),
+        params={"url": f"https://www.youtube.com/watch?v={video_id}", "format": "json"},
+    )
+    if response.status_code == 200:
+        return response_json(response)
+    # oEmbed answers 401/403 for videos that exist but have embedding disabled
+    if response.status_code in (401, 403):
+        return {}
+    if response.status_code in (400, 404):
+        return None
+    raise requests.HTTPError(f"Unexpected oEmbed status {response.status_code}", response=response)
+
+
 def is_valid_url(url, timeout=5):
     """
-    Check URL validity by attempting to connect and get a 200 OK response.
+    Check that a URL points to an existing YouTube video, using the video id and a cached metadata probe.
     
     Args:
         url (str): The URL to validate
-        timeout (int, optional): Connection timeout in seconds. Defaults to 5.
+        timeout (int, optional): Probe read timeout in seconds. Defaults to 5.
     
     Returns:
-        bool: True if URL is valid and returns 200 OK, False otherwise
+        bool: True if the URL contains a YouTube video id that YouTube knows about, False otherwise
     """
+    video_id = extract_youtube_id(url)
+    if video_id is None:
+        return False
+
     try:
-        # Add default scheme if not present
-        if not url.startswith(('http://', 'https://')):
-            url = 'http://' + url
-        
-        # Send a HEAD request to minimize data transfer
-        response = requests.head(url, timeout=timeout)
-        
-        # Check if status code is 200
-        return response.status_code == 200
-    
-    except (requests.ConnectionError, 
-            requests.Timeout, 
-            requests.RequestException):
+        return get_youtube_metadata(video_id, timeout) is not None
+    except requests.RequestException:
         return False
 
 
-# Function to load JSON from a file
+# Function to load JSON from a file (plain JSON or compressed analysis archive)
 def load_json(filename):
+    if is_archive(filename):
+        return load_archive(filename)
     with open(filename, 'r') as file:
         return json.load(file)
 
@@ -157,16 +262,21 @@ def save_json(data, filename):
     print(f"Response saved locally as {filename}")
 
 
-def add_entry_json(file_path, new_entry):
+def add_entry_json(file_path, new_entry, key=None):
     """
     Add a new entry to an existing JSON file.
+    If `key` is given, an existing entry with the same value for `key` is replaced instead.
     """
     # Read the existing JSON file
     with open(file_path, 'r') as file:
         data = json.load(file)
 
-    # Append the new entry
-    data.append(new_entry)
+    # Replace the matching entry, or append the new one
+    position = next((i for i, entry in enumerate(data) if key is not None and entry.get(key) == new_entry.get(key)), None)
+    if position is None:
+        data.append(new_entry)
+    else:
+        data[position] = new_entry
 
     # Write the updated data back to the file
     with open(file_path, 'w') as file:
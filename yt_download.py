@@ -1,20 +1,239 @@
 import yt_dlp
 import os
+import shutil
+import subprocess
 from pathlib import Path
 
 
-def download_youtube_video(url, output_path=os.getcwd(), quality="medium"):
+# Smallest resolution / frame rate the analyzer still detects triggers reliably at
+ANALYSIS_MIN_HEIGHT = int(os.getenv("ANALYSIS_MIN_HEIGHT", "360"))
+ANALYSIS_MIN_FPS = int(os.getenv("ANALYSIS_MIN_FPS", "24"))
+
+# Seconds before a local ffmpeg pass is abandoned and the original file is uploaded instead
+FFMPEG_TIMEOUT = int(os.getenv("FFMPEG_TIMEOUT", "300"))
+
+
+def analysis_format(min_height=ANALYSIS_MIN_HEIGHT, min_fps=ANALYSIS_MIN_FPS):
+    """
+    Build a yt-dlp format string for the "analysis" profile: MP4 video at or above the
+    resolution/fps floor plus M4A audio (the analyzer needs the transcript). Combined with
+    analysis_format_sort() this picks the smallest format that meets the floor. Videos that
+    never reach the fps floor keep the resolution floor; videos below the resolution floor
+    fall through to bv*+ba/b and are corrected by largest_format_below_floor().
+    """
+    video_filter = f"[height>={min_height}][fps>=?{min_fps}]"
+    height_filter = f"[height>={min_height}]"
+    return (
+        f"bv*{video_filter}[ext=mp4]+ba[ext=m4a]/"
+        f"b{video_filter}[ext=mp4]/"
+        f"bv*{video_filter}+ba/"
+        f"b{video_filter}/"
+        f"bv*{height_filter}+ba/"
+        f"b{height_filter}/"
+        f"bv*+ba/b"
+    )
+
+
+def analysis_format_sort():
+    """Ascending sort order so that "best" means smallest resolution, frame rate and size."""
+    return ["+res", "+fps", "+size", "+br"]
+
+
+def selected_height(info):
+    """Height of the video format yt-dlp selected, or 0 if unknown."""
+    requested = info.get("requested_formats") or [info]
+    return max((fmt.get("height") or 0) for fmt in requested)
+
+
+def largest_format_below_floor(info):
+    """
+    Format spec for the highest-resolution video a source offers, for sources that never reach
+    the resolution floor (where the ascending analysis sort would pick the smallest, e.g. 144p).
+    Video-only formats are paired with the best audio. Returns None if no format has a height.
+    """
+    videos = [
+        fmt for fmt in info.get("formats") or []
+        if fmt.get("vcodec") not in (None, "none") and fmt.get("height")
+    ]
+    if not videos:
+        return None
+    best = max(videos, key=lambda fmt: (fmt["height"], fmt.get("fps") or 0, fmt.get("ext") == "mp4"))
+    if best.get("acodec") in (None, "none"):
+        return f"{best['format_id']}+ba/{best['format_id']}"
+    return best["format_id"]
+
+
+def format_size(fmt):
+    """Return the exact or approximate size of a yt-dlp format in bytes, or 0 if unknown."""
+    return fmt.get("filesize") or fmt.get("filesize_approx") or 0
+
+
+def selected_format_bytes(info):
+    """Estimated bytes for the format(s) yt-dlp selected for download."""
+    requested = info.get("requested_formats") or [info]
+    return sum(format_size(fmt) for fmt in requested)
+
+
+def medium_format_bytes(info, max_height=720):
+    """
+    Estimate the bytes the "medium" profile would have downloaded: the largest MP4 video
+    at or below 720p plus the best M4A audio track.
+    """
+    formats = info.get("formats") or []
+    videos = [
+        f for f in formats
+        if f.get("vcodec") not in (None, "none") and f.get("ext") == "mp4"
+        and (f.get("height") or 0) <= max_height
+    ]
+    audios = [
+        f for f in formats
+        if f.get("vcodec") == "none" and f.get("acodec") not in (None, "none") and f.get("ext") == "m4a"
+    ]
+    video_bytes = max((format_size(f) for f in videos), default=0)
+    audio_bytes = max((format_size(f) for f in audios), default=0)
+    return video_bytes + audio_bytes
+
+
+def ffmpeg_postprocess(video_path, mode="downscale", max_height=ANALYSIS_MIN_HEIGHT, max_fps=ANALYSIS_MIN_FPS):
+    """
+    Run a fast local ffmpeg pass before upload.
+
+    Args:
+        video_path (str): Path to the downloaded video
+        mode (str, optional): "remux" copies streams and moves the index to the front,
+            "downscale" re-encodes to at most max_height/max_fps. Defaults to "downscale".
+        max_height (int, optional): Output height cap for "downscale"
+        max_fps (int, optional): Output frame rate cap for "downscale"
+
+    Returns:
+        str: Path to the smaller file (the original is replaced), or the untouched original
+        if ffmpeg is unavailable, fails, exceeds FFMPEG_TIMEOUT or does not reduce the size.
+        Non-MP4 input is always replaced by the MP4 output, which may change the extension.
+    """
+    if shutil.which("ffmpeg") is None:
+        print("ffmpeg not found, skipping post-processing.")
+        return video_path
+
+    tmp_path = f"{video_path}.{mode}.mp4"
+    if mode == "remux":
+        codec_args = ["-c", "copy"]
+    else:
+        codec_args = [
+            "-vf", f"scale=-2:'min(ih,{max_height})',fps={max_fps}",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+            "-c:a", "aac", "-b:a", "64k",
+        ]
+    command = ["ffmpeg", "-y", "-loglevel", "error", "-i", video_path, *codec_args, "-movflags", "+faststart", tmp_path]
+
+    try:
+        subprocess.run(command, check=True, timeout=FFMPEG_TIMEOUT)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+        print(f"ffmpeg {mode} failed: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return video_path
+
+    output_path = f"{os.path.splitext(video_path)[0]}.mp4"
+    if output_path != video_path or os.path.getsize(tmp_path) < os.path.getsize(video_path):
+        os.replace(tmp_path, output_path)
+        if output_path != video_path:
+            os.remove(video_path)
+        return output_path
+    os.remove(tmp_path)
+    return video_path
+
+
+def download_for_analysis(url, output_path=os.getcwd(), max_length=None,
+                          min_height=ANALYSIS_MIN_HEIGHT, min_fps=ANALYSIS_MIN_FPS, ffmpeg_mode="remux"):
+    """
+    Download a YouTube video with the "analysis" profile, which moves as few bytes as
+    possible while keeping enough detail for key-frame sampling and transcription.
+
+    Args:
+        url (str): The URL of the YouTube video
+        output_path (str, optional): Directory to save the video. Defaults to the current directory.
+        max_length (int, optional): Skip videos longer than this many seconds
+        min_height (int, optional): Resolution floor in pixels
+        min_fps (int, optional): Frame rate floor
+        ffmpeg_mode (str, optional): "remux", "downscale" or None to skip the local ffmpeg pass.
+            Defaults to "remux"; "downscale" re-encodes and is CPU-heavy on the app host, so it is opt-in.
+
+    Returns:
+        tuple: (path to the downloaded video file or None, report dict with
+        baseline_bytes, selected_bytes, final_bytes and bytes_saved)
+    """
+    report = {"profile": "analysis", "baseline_bytes": 0, "selected_bytes": 0, "final_bytes": 0, "bytes_saved": 0}
+    try:
+        ydl_opts = {
+            'format': analysis_format(min_height, min_fps),
+            'format_sort': analysis_format_sort(),
+            'merge_output_format': 'mp4',
+            'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
+            'progress_hooks': [lambda d: print(f"Downloading: {d.get('_percent_str', '')} of {d.get('_total_bytes_str', '')}")],
+        }
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            print("Getting video information...")
+            info = ydl.extract_info(url, download=False)
+            print(f"\nTitle: {info['title']}")
+            print(f"Duration: {info['duration']} seconds")
+            print(f"Resolution: {info.get('resolution', 'N/A')}")
+
+            if max_length is not None and (info.get('duration') or 0) > max_length:
+                print(f"Video is longer than {max_length} seconds, skipping.")
+                return None, report
+
+        # Below the resolution floor the ascending sort would pick the smallest format
+        if selected_height(info) < min_height:
+            fallback_format = largest_format_below_floor(info)
+            if fallback_format:
+                print(f"No format reaches {min_height}p, downloading the largest one ({fallback_format}) instead.")
+                ydl_opts['format'] = fallback_format
+
+        print("\nStarting download...")
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            downloaded = ydl.extract_info(url)
+            # yt-dlp sanitizes the title in file names and unmerged formats may not be MP4
+            video_path = downloaded['requested_downloads'][0]['filepath']
+
+        if ffmpeg_mode:
+            video_path = ffmpeg_postprocess(video_path, ffmpeg_mode, min_height, min_fps)
+
+        report["baseline_bytes"] = medium_format_bytes(info)
+        report["selected_bytes"] = selected_format_bytes(info)
+        report["final_bytes"] = os.path.getsize(video_path)
+        if report["baseline_bytes"]:
+            report["bytes_saved"] = max(report["baseline_bytes"] - report["final_bytes"], 0)
+
+        print(f"\nDownload completed successfully!")
+        print(f"Video saved to: {video_path}")
+        print(f"Analysis profile: {report['final_bytes']} bytes (medium profile ~{report['baseline_bytes']} bytes, "
+              f"saved ~{report['bytes_saved']} bytes)")
+        return video_path, report
+
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return None, report
+
+
+def download_youtube_video(url, output_path=os.getcwd(), quality="medium", max_length=None):
     """
     Download a YouTube video in the selected quality and MP4 format using yt-dlp.
 
     Args:
         url (str): The URL of the YouTube video
-        output_path (str, optional): Directory to save the video. Defaults to Downloads folder.
-        quality (str, optional): Video quality. Options are "high", "medium", or "low". Defaults to "high".
+        output_path (str, optional): Directory to save the video. Defaults to the current directory.
+        quality (str, optional): Video quality. Options are "high", "medium", "low" or "analysis"
+            (smallest format meeting the analysis floor, see download_for_analysis). Defaults to "medium".
+        max_length (int, optional): Skip videos longer than this many seconds
 
     Returns:
         str: Path to the downloaded video file
     """
+    if quality.lower() == "analysis":
+        video_path, _ = download_for_analysis(url, output_path, max_length=max_length)
+        return video_path
+
     try:
         # Define yt-dlp format strings for different quality levels, all in MP4 format
         quality_formats = {
@@ -41,6 +260,10 @@ def download_youtube_video(url, output_path=os.getcwd(), quality="medium"):
             print(f"Duration: {info['duration']} seconds")
             print(f"Resolution: {info.get('resolution', 'N/A')}")
 
+            if max_length is not None and (info.get('duration') or 0) > max_length:
+                print(f"Video is longer than {max_length} seconds, skipping.")
+                return None
+
             print("\nStarting download...")
             ydl.download([url])
 